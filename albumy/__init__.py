@@ -9,9 +9,11 @@ from albumy.blueprints.auth import auth_bp
 from albumy.blueprints.user import user_bp
 from albumy.blueprints.admin import admin_bp
 from albumy.settings import config
-from albumy.extensions import db, bootstrap, mail, login_manager, migrate, moment, dropzone, avatars, csrf
-from albumy.models import Collect, Comment, Follow, Notification, Photo, User, Role, Permission, Tag
+from albumy.extensions import db, bootstrap, mail, login_manager, migrate, moment, dropzone, avatars, csrf, cache
+from albumy.models import Collect, Comment, Follow, Photo, User, Role, Permission, Tag
 from albumy.commands import cli_commands
+from albumy.jobs import thumbnail_queue
+from albumy.notifications import notification_aggregator
 
 
 def create_app(config_name=None):
@@ -43,6 +45,9 @@ def register_extensions(app):
     dropzone.init_app(app)
     avatars.init_app(app)
     csrf.init_app(app)
+    cache.init_app(app)
+    thumbnail_queue.init_app(app)
+    notification_aggregator.init_app(app)
 
 
 def register_blueprints(app):
@@ -72,7 +77,7 @@ def register_template_context(app):
     @app.context_processor
     def make_template_context():
         if current_user.is_authenticated:
-            notification_count = Notification.query.with_parent(current_user).filter_by(is_read=False).count()
+            notification_count = current_user.unread_notification_count
         else:
             notification_count = None
             
@@ -6,7 +6,9 @@ from flask_login.utils import login_required
 
 from albumy.decorators import admin_required, permission_requeired
 from albumy.models import User, Role, Photo, Tag, Comment
+from albumy import loaders
 from albumy.utils import redirect_back
+from albumy.stats import admin_stats, user_activity
 from albumy.forms.admin import EditProfileAdminForm
 from albumy.extensions import db
 
@@ -18,24 +20,7 @@ admin_bp = Blueprint('admin', __name__)
 @login_required
 @permission_requeired('MODERATE')
 def index():
-    user_count = User.query.count()
-    locked_users_count = User.query.filter_by(locked=True).count()
-    blocked_users_count = User.query.filter_by(active=False).count()
-    photo_count = Photo.query.count()
-    reproted_photos_count = Photo.query.filter(Photo.flag > 0).count()
-    tag_count = Tag.query.count()
-    comment_count = Comment.query.count()
-    reported_comments_count = Comment.query.filter(Comment.flag > 0).count()
-    return render_template('admin/index.html', 
-                            user_count=user_count,
-                            photo_count=photo_count,
-                            tag_count=tag_count,
-                            comment_count=comment_count,
-                            locked_users_count=locked_users_count,
-                            blocked_users_count=blocked_users_count,
-                            reported_comments_count=reported_comments_count,
-                            reproted_photos_count=reproted_photos_count
-                        )
+    return render_template('admin/index.html', **admin_stats())
 
 
 # 管理员编辑用户资料
@@ -123,6 +108,15 @@ def delete_tag(tag_id):
     flash('Tag deleted.', 'info')
     return redirect_back()
 
+# 前缀匹配条件。SQLite的LIKE不区分大小写，不能使用按BINARY排序的索引，所以其他数据库都使用范围条件
+# column >= 'abc' AND column < 'abd'；PostgreSQL在非C排序规则下使用LIKE 'abc%'，由varchar_pattern_ops索引支持
+def _prefix_match(column, prefix):
+    if db.engine.dialect.name == 'postgresql':
+        pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return column.like(pattern, escape='\\')
+    return db.and_(column >= prefix, column < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
 @admin_bp.route('/manage/user')
 @login_required
 @permission_requeired('MODERATE')
@@ -144,9 +138,18 @@ def manage_user():
     else:
         filtered_users = User.query
 
-    pagination = filtered_users.order_by(User.member_since.desc()).paginate(page, per_page, error_out=False)
+    # 按用户名或邮箱的前缀搜索，邮箱保存为小写
+    q = request.args.get('q', '').strip()
+    if q:
+        filtered_users = filtered_users.filter(db.or_(
+            _prefix_match(User.username, q),
+            _prefix_match(User.email, q.lower())
+        ))
+
+    pagination = filtered_users.options(*loaders.MANAGE_USER_LIST).order_by(User.member_since.desc()).paginate(page, per_page, error_out=False)
     users = pagination.items
-    return render_template('admin/manage_user.html', pagination=pagination, users=users)
+    activity = user_activity(user.id for user in users)
+    return render_template('admin/manage_user.html', pagination=pagination, users=users, activity=activity, q=q)
 
 
 @admin_bp.route('/manage/photo', defaults={'order': 'by_flag'})
@@ -158,10 +161,10 @@ def manage_photo(order):
     per_page = current_app.config['ALBUMY_MANAGE_PHOTO_PER_PAGE']
     order_rule = 'flag'
     if order == 'by_time':
-        pagination = Photo.query.order_by(Photo.timestamp.desc()).paginate(page, per_page, error_out=False)
+        pagination = Photo.query.options(*loaders.MANAGE_PHOTO_LIST).order_by(Photo.timestamp.desc()).paginate(page, per_page, error_out=False)
         order_rule = 'time'
     else:
-        pagination = Photo.query.order_by(Photo.flag.desc()).paginate(page, per_page, error_out=False)
+        pagination = Photo.query.options(*loaders.MANAGE_PHOTO_LIST).order_by(Photo.flag.desc()).paginate(page, per_page, error_out=False)
     photos = pagination.items
     return render_template('admin/manage_photo.html', pagination=pagination, photos=photos, order_rule=order_rule)
 
@@ -186,10 +189,10 @@ def manage_comment(order):
     per_page = current_app.config['ALBUMY_MANAGE_COMMENT_PER_PAGE']
     order_rule = 'flag'
     if order == 'by_time':
-        pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(page, per_page, error_out=False)
+        pagination = Comment.query.options(*loaders.MANAGE_COMMENT_LIST).order_by(Comment.timestamp.desc()).paginate(page, per_page, error_out=False)
         order_rule = 'time'
     else:
-        pagination = Comment.query.order_by(Comment.flag.desc()).paginate(page, per_page, error_out=False)
+        pagination = Comment.query.options(*loaders.MANAGE_COMMENT_LIST).order_by(Comment.flag.desc()).paginate(page, per_page, error_out=False)
     comments = pagination.items
     return render_template('admin/manage_comment.html', pagination=pagination, comments=comments, order_rule=order_rule)
     
\ No newline at end of file
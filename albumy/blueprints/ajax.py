@@ -1,9 +1,11 @@
-from flask import Blueprint, json, render_template, jsonify
+from datetime import datetime, timezone
+
+from flask import Blueprint, json, render_template, jsonify, request
 from flask.signals import message_flashed
 from  flask_login import current_user
 
-from albumy.models import Notification, Photo, User
-from albumy.notifications import push_collect_notification
+from albumy.models import Photo, User
+from albumy.notifications import push_collect_notification, mark_notifications_read
 
 ajax_bp = Blueprint('ajax', __name__)
 
@@ -19,7 +21,7 @@ def get_profile(user_id):
 @ajax_bp.route('/followers-count/<int:user_id>')
 def followers_count(user_id):
     user = User.query.get_or_404(user_id)
-    count = user.followers.count() - 1
+    count = user.follower_count - 1
     return jsonify(count=count)
 
 
@@ -62,14 +64,32 @@ def notifications_count():
     if not current_user.is_authenticated:
         return jsonify(message='Login required'), 403
     
-    count = Notification.query.with_parent(current_user).filter_by(is_read=False).count()
-    return jsonify(count=count)
+    return jsonify(count=current_user.unread_notification_count)
+
+
+# 批量标记通知为已读：max_id（通知id）、until（ISO 8601格式的UTC时间）都为空时标记全部未读通知
+@ajax_bp.route('/notifications/read', methods=['POST'])
+def read_notifications():
+    if not current_user.is_authenticated:
+        return jsonify(message='Login required.'), 403
+
+    data = request.get_json(silent=True) or request.form
+    try:
+        max_id = int(data['max_id']) if data.get('max_id') is not None else None
+        until = datetime.fromisoformat(data['until'].replace('Z', '+00:00')) if data.get('until') else None
+    except (TypeError, ValueError):
+        return jsonify(message='Invalid max_id or until.'), 400
+    if until is not None and until.tzinfo is not None:
+        until = until.astimezone(timezone.utc).replace(tzinfo=None)
+
+    count = mark_notifications_read(current_user, max_id=max_id, until=until)
+    return jsonify(message='%d notifications read.' % count, count=current_user.unread_notification_count)
 
 
 @ajax_bp.route('/<int:photo_id>/collectors-count')
 def collectors_count(photo_id):
     photo = Photo.query.get_or_404(photo_id)
-    count = len(photo.collectors)
+    count = photo.collect_count
     return jsonify(count=count)
 
 
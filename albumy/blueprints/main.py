@@ -1,20 +1,31 @@
 from logging import log
 import os
 
-from flask import Blueprint, render_template, request, current_app, send_from_directory, flash, abort
+from flask import Blueprint, render_template, request, current_app, flash, abort
 from flask.helpers import url_for
 from flask_dropzone import random_filename
 from flask_login import login_required, current_user
 from sqlalchemy.engine import url
 from werkzeug.utils import redirect
-from sqlalchemy.sql.expression import func
 
 from albumy.extensions import db
 from albumy.decorators import permission_requeired, confirm_required
-from albumy.models import Follow, Photo, Tag, Comment, Collect, Notification
-from albumy.utils import flash_errors, resize_image
+from albumy.models import Photo, Tag, Comment, Collect, Notification
+from albumy import loaders
+from albumy.counters import PhotoCounter
+from albumy.relations import preload_relations
+from albumy.pagination import cursor_paginate
+from albumy.feeds import home_feed
+from albumy.trending import trending_tags
+from albumy.tags import attach_tags, detach_tag
+from albumy.derivatives import get_derivative
+from albumy.explore import explore_photos
+from albumy.comments import comment_page, invalidate_comments
+from albumy.deletion import delete_photos
+from albumy.utils import flash_errors, send_immutable
+from albumy.jobs import thumbnail_queue, QueueFull
 from albumy.forms.main import DescriptionForm, TagForm, CommentForm
-from albumy.notifications import push_comment_notification, push_collect_notification
+from albumy.notifications import push_comment_notification, push_collect_notification, mark_notifications_read
 
 
 main_bp = Blueprint('main', __name__)
@@ -23,35 +34,38 @@ main_bp = Blueprint('main', __name__)
 @main_bp.route('/')
 def index():
     if current_user.is_authenticated:
-        page = request.args.get('page', 1, type=int)
         per_page = current_app.config['ALBUMY_PHOTO_PER_PAGE']
-        pagination = Photo.query \
-                        .join(Follow, Follow.followed_id == Photo.author_id) \
-                        .filter(Follow.follower_id == current_user.id) \
-                        .order_by(Photo.timestamp.desc()) \
-                        .paginate(page, per_page, error_out=False)
+        pagination = home_feed(current_user, per_page, options=loaders.PHOTO_LIST)
         photos = pagination.items                        
+        preload_relations(photos=photos)
     else:
         pagination = None
         photos = None
-    tags = Tag.query.join(Tag.photos).group_by(Tag.id).order_by(func.count(Photo.id).desc()).limit(10)
-    return render_template('main/index.html', pagination=pagination, photos=photos, tags=tags, Collect=Collect)
+    tags = trending_tags()
+    return render_template('main/index.html', pagination=pagination, photos=photos, tags=tags, Collect=Collect,
+                           photo_counter=PhotoCounter())
 
 
 @main_bp.route('/explore')
 def explore():
-    photos = Photo.query.order_by(func.random()).limit(12)
-    return render_template('main/explore.html', photos=photos)
+    photos = explore_photos(current_app.config['ALBUMY_EXPLORE_PER_PAGE'])
+    return render_template('main/explore.html', photos=photos, photo_counter=PhotoCounter())
 
 
 @main_bp.route('/avatars/<path:filename>')
 def get_avatar(filename):
-    return send_from_directory(current_app.config['AVATARS_SAVE_PATH'], filename)
+    return send_immutable(current_app.config['AVATARS_SAVE_PATH'], filename)
 
 
 @main_bp.route('/uploads/<path:filename>')
 def get_image(filename):
-    return send_from_directory(current_app.config['ALBUMY_UPLOAD_PATH'], filename)
+    return send_immutable(current_app.config['ALBUMY_UPLOAD_PATH'], filename)
+
+
+# 按预设尺寸获取图片，第一次访问时生成
+@main_bp.route('/uploads/<preset>/<filename>')
+def get_image_preset(preset, filename):
+    return send_immutable(get_derivative(preset, filename), filename)
 
 # 上传图片
 @main_bp.route('/upload', methods=['GET', 'POST'])
@@ -60,19 +74,28 @@ def get_image(filename):
 @permission_requeired('UPLOAD')
 def upload():
     if request.method == 'POST' and 'file' in request.files:
+        # 缩略图队列已满时拒绝上传，Dropzone会显示错误信息，用户可以稍后重试
+        if thumbnail_queue.is_full():
+            return 'Server is busy, please try again later.', 503
         f = request.files.get('file') # 获取图片对象
         filename = random_filename(f.filename) # 生成随机文件名
         f.save(os.path.join(current_app.config['ALBUMY_UPLOAD_PATH'], filename)) # 保存文件对象
-        filename_s = resize_image(f, filename, current_app.config['ALBUMY_PHOTO_SIZE']['small'])
-        filename_m = resize_image(f, filename, current_app.config['ALBUMY_PHOTO_SIZE']['medium'])
+        # 缩略图生成之前先使用原图，记录标记为处理中
         photo = Photo(
             filename=filename,
-            filename_s=filename_s,
-            filename_m=filename_m,
+            filename_s=filename,
+            filename_m=filename,
+            processing=True,
             author=current_user._get_current_object()
         )
         db.session.add(photo)
         db.session.commit()
+        try:
+            thumbnail_queue.submit(photo)
+        except QueueFull:
+            # 检查之后进程池被其他请求占满，在当前请求中生成缩略图
+            current_app.logger.warning('Thumbnail queue is full, generating photo %s inline.', photo.id)
+            thumbnail_queue.generate(photo.id, photo.filename)
     
     return render_template('main/upload.html')
 
@@ -80,18 +103,21 @@ def upload():
 # 图片：展示图片、上一张图片、下一张图片、删除图片、举报图片、修改图片描述
 @main_bp.route('/photo/<int:photo_id>')
 def show_photo(photo_id):
-    photo = Photo.query.get_or_404(photo_id)
+    photo = Photo.query.options(*loaders.PHOTO_DETAIL).get_or_404(photo_id)
     page = request.args.get('page', 1, type=int)
     per_page = current_app.config['ALBUMY_COMMENT_PER_PAGE']
-    pagination = Comment.query.with_parent(photo).order_by(Comment.timestamp.asc()).paginate(page, per_page, error_out=False)
+    pagination = comment_page(photo, page, per_page)
     comments = pagination.items
 
     comment_form = CommentForm()
     tag_form = TagForm()
     description_form = DescriptionForm()
     description_form.description.data = photo.description
+    previous_photo, next_photo = photo.neighbors()
     return render_template('main/photo.html', 
                                 photo=photo,
+                                previous_photo=previous_photo,
+                                next_photo=next_photo,
                                 comments=comments,
                                 pagination=pagination, 
                                 description_form=description_form,
@@ -103,7 +129,7 @@ def show_photo(photo_id):
 @main_bp.route('/photo/next/<int:photo_id>')
 def photo_next(photo_id):
     photo = Photo.query.get_or_404(photo_id)
-    photo_n = Photo.query.with_parent(photo.author).filter(Photo.id < photo_id).order_by(Photo.id.desc()).first()
+    photo_n = photo.neighbors()[1]
     if photo_n is None:
         flash('This is already the last one.', 'info')
         return redirect(url_for('.show_photo', photo_id=photo_id))
@@ -113,7 +139,7 @@ def photo_next(photo_id):
 @main_bp.route('/photo/pre/<int:photo_id>')
 def photo_previous(photo_id):
     photo = Photo.query.get_or_404(photo_id)
-    photo_p = Photo.query.with_parent(photo.author).filter(Photo.id > photo_id).order_by(Photo.id.asc()).first()
+    photo_p = photo.neighbors()[0]
     if photo_p is None:
         flash('This is already the first one.', 'info')
         return redirect(url_for('.show_photo', photo_id=photo_id))    
@@ -126,19 +152,18 @@ def delete_photo(photo_id):
     photo = Photo.query.get_or_404(photo_id)
     if current_user != photo.author and not current_user.can('MODERATE'):
         abort(403)
-    
-    db.session.delete(photo)
-    db.session.commit()
+
+    # 删除之前查找相邻的照片，删除后跳转到下一张，没有下一张时跳转到上一张
+    photo_p, photo_n = photo.neighbors()
+    username = photo.author.username
+    delete_photos([photo.id])
 
     flash('Photo deleted.', 'info')
 
-    photo_n = Photo.query.with_parent(photo.author).filter(Photo.id < photo_id).order_by(Photo.id.desc()).first()
-    if photo_n is None:
-        photo_p = Photo.query.with_parent(photo.author).filter(Photo.id > photo_id).order_by(Photo.id.asc()).first()
-        if photo_p is None:
-            return redirect(url_for('user.index', username=photo.author.username))
-        return redirect(url_for('.show_photo', photo_id=photo_p.id))
-    return redirect(url_for('.show_photo', photo_id=photo_n.id))
+    neighbor = photo_n or photo_p
+    if neighbor is None:
+        return redirect(url_for('user.index', username=username))
+    return redirect(url_for('.show_photo', photo_id=neighbor.id))
 
 
 @main_bp.route('/report/photo/<int:photo_id>', methods=['POST'])
@@ -206,6 +231,7 @@ def new_comment(photo_id):
                 push_comment_notification(photo_id=photo.id, receiver=comment.replied.author)
         db.session.add(comment)
         db.session.commit()
+        invalidate_comments(photo_id)
         flash('Comment phblished.', 'success')
         
         # 给照片作者发送评论通知
@@ -232,6 +258,7 @@ def delete_comment(comment_id):
         abort(403)
     db.session.delete(comment)
     db.session.commit()
+    invalidate_comments(comment.photo_id)
     flash('Comment deleted.', 'info')
     return redirect(url_for('.show_photo', photo_id=comment.photo_id))
 
@@ -256,15 +283,7 @@ def new_tag(photo_id):
     
     form = TagForm()
     if form.validate_on_submit():
-        for name in form.tag.data.split():
-            tag = Tag.query.filter_by(name=name).first()
-            if tag is None:
-                tag = Tag(name=name)
-                db.session.add(tag)
-                db.session.commit()
-            if tag not in photo.tags:
-                photo.tags.append(tag)
-                db.session.commit()
+        attach_tags(photo, form.tag.data.split())
         flash('Tag added.', 'success')
         flash_errors(form)
 
@@ -279,13 +298,7 @@ def delete_tag(photo_id, tag_id):
     if current_user != photo.author and not current_user.can('MODERATE'):
         abort(403)
 
-    photo.tags.remove(tag)
-    db.session.commit()
-
-    if not tag.photos:
-        db.session.delete(tag)
-        db.session.commit()
-
+    detach_tag(photo, tag)
     flash('Tag deleted.', 'info')
     return redirect(url_for('.show_photo', photo_id=photo_id))
 
@@ -294,17 +307,18 @@ def delete_tag(photo_id, tag_id):
 @main_bp.route('/tag/<int:tag_id>/<order>')
 def show_tag(tag_id, order):
     tag = Tag.query.get_or_404(tag_id)
-    page = request.args.get('page', 1, type=int)
     per_page = current_app.config['ALBUMY_PHOTO_PER_PAGE']
     order_rule = 'time'
-    pagination = Photo.query.with_parent(tag).order_by(Photo.timestamp.desc()).paginate(page, per_page, error_out=False)
+    pagination = cursor_paginate(Photo.query.with_parent(tag), (Photo.timestamp, Photo.id), per_page)
     photos = pagination.items
+    photo_counter = PhotoCounter()
 
     if order == 'by_collects':
-        photos.sort(key=lambda x: len(x.collectors), reverse=True)
+        photos.sort(key=photo_counter.collect_count, reverse=True)
         order_rule = 'collects'
     
-    return render_template('main/tag.html', tag=tag, photos=photos, pagination=pagination, order_rule=order_rule)
+    return render_template('main/tag.html', tag=tag, photos=photos, pagination=pagination, order_rule=order_rule,
+                           photo_counter=photo_counter)
 
 
 # 收藏：新增收藏、取消收藏、
@@ -343,21 +357,21 @@ def show_collectors(photo_id):
     photo = Photo.query.get_or_404(photo_id)
     page = request.args.get('page', 1, type=int)
     per_page = current_app.config['ALBUMY_USER_PER_PAGE']
-    pagination = Collect.query.with_parent(photo).order_by(Collect.timestamp.asc()).paginate(page, per_page, error_out=False)
+    pagination = Collect.query.with_parent(photo).options(*loaders.COLLECTOR_LIST).order_by(Collect.timestamp.asc()).paginate(page, per_page, error_out=False)
     collects = pagination.items
+    preload_relations(users=[collect.collector for collect in collects])
     return render_template('main/collectors.html', collects=collects, pagination=pagination, photo=photo)
 
 # 展示通知消息
 @main_bp.route('/notifications')
 def show_notifications():
-    page = request.args.get('page', 1, type=int)
     per_page = current_app.config['ALBUMY_NOTIFICATION_PER_PAGE']
     notifications = Notification.query.with_parent(current_user)
     filter_rule = request.args.get('filter')
     if filter_rule == 'unread':
         notifications = notifications.filter_by(is_read=False)
 
-    pagination = notifications.order_by(Notification.timestamp.desc()).paginate(page, per_page, error_out=False)
+    pagination = cursor_paginate(notifications, (Notification.timestamp, Notification.id), per_page)
     notifications = pagination.items
 
     return render_template('main/notifications.html', pagination=pagination, notifications=notifications)
@@ -378,8 +392,7 @@ def read_notification(notification_id):
 # 阅读所有通知消息
 @main_bp.route('/notifications/read/all', methods=['POST'])
 def read_all_notification():
-    for notification in current_user.notifications:
-        notification.is_read = True
-    db.session.commit()
+    # max_id是页面上最大的通知id（合并写入的通知按时间排序时id不一定递增），页面打开之后收到的通知保持未读
+    mark_notifications_read(current_user, max_id=request.form.get('max_id', type=int))
     flash('All notifications archived.', 'success')
     return redirect(url_for('.show_notifications'))
\ No newline at end of file
@@ -4,11 +4,16 @@ from flask_login.utils import logout_user
 from albumy.emails import send_confirm_email
 
 from albumy.models import Photo, User, Collect
+from albumy import loaders
+from albumy.counters import PhotoCounter
 from albumy.extensions import db, avatars
+from albumy.relations import preload_relations
+from albumy.pagination import cursor_paginate
 from albumy.decorators import confirm_required, permission_requeired
 from albumy.settings import Operations
 from albumy.utils import flash_errors, generate_token, redirect_back, validate_token
 from albumy.notifications import push_follow_notification
+from albumy.deletion import delete_account as delete_user_account
 from albumy.forms.user import ChangeEmailForm, ChangePasswordForm, CropAvatarForm, DeleteAccountForm, EditPrifileForm, UploadAvatarForm, NotificationSettingForm, PrivacyForm
 
 
@@ -24,22 +29,23 @@ def index(username):
     # 当前用户被封禁，则自动登出用户
     if user == current_user and not user.active:
         logout_user()
-    page = request.args.get('page', 1, type=int)
     per_page = current_app.config['ALBUMY_PHOTO_PER_PAGE']
-    pagination = Photo.query.with_parent(user).order_by(Photo.timestamp.desc()).paginate(page, per_page, error_out=False)
+    pagination = cursor_paginate(Photo.query.with_parent(user), (Photo.timestamp, Photo.id), per_page)
     photos = pagination.items
-    return render_template('user/index.html', user=user, photos=photos, pagination=pagination)
+    return render_template('user/index.html', user=user, photos=photos, pagination=pagination,
+                           photo_counter=PhotoCounter())
 
 
 # 展示用户收藏内容
 @user_bp.route('/<username>/collections')
 def show_collections(username):
     user = User.query.filter_by(username=username).first_or_404()
-    page = request.args.get('page', 1, type=int)
     per_page = current_app.config['ALBUMY_PHOTO_PER_PAGE']
-    pagination = Collect.query.with_parent(user).order_by(Collect.timestamp.desc()).paginate(page, per_page, error_out=False)
+    # 同一用户的收藏中collected_id唯一，与时间一起作为排序字段
+    pagination = cursor_paginate(Collect.query.with_parent(user).options(*loaders.COLLECTION_LIST), (Collect.timestamp, Collect.collected_id), per_page)
     collects = pagination.items
-    return render_template('user/collections.html', user=user, pagination=pagination, collects=collects)
+    return render_template('user/collections.html', user=user, pagination=pagination, collects=collects,
+                           photo_counter=PhotoCounter())
 
 
 # 关注（有关注权限的才能进行关注）
@@ -78,8 +84,9 @@ def show_followers(username):
     user = User.query.filter_by(username=username).first_or_404()
     page = request.args.get('page', 1, type=int)
     per_page = current_app.config['ALBUMY_USER_PER_PAGE']
-    pagination = user.followers.paginate(page, per_page, error_out=False)
+    pagination = user.followers.options(*loaders.FOLLOWER_LIST).paginate(page, per_page, error_out=False)
     follows = pagination.items
+    preload_relations(users=[user] + [follow.follower for follow in follows])
     return render_template('user/followers.html', follows=follows, pagination=pagination, user=user)
 
 
@@ -89,8 +96,9 @@ def show_following(username):
     user = User.query.filter_by(username=username).first_or_404()
     page = request.args.get('page', 1, type=int)
     per_page = current_app.config['ALBUMY_USER_PER_PAGE']
-    pagination = user.following.paginate(page, per_page, error_out=False)
+    pagination = user.following.options(*loaders.FOLLOWING_LIST).paginate(page, per_page, error_out=False)
     follows = pagination.items
+    preload_relations(users=[user] + [follow.followed for follow in follows])
     return render_template('user/following.html', follows=follows, pagination=pagination, user=user)
 
 
@@ -243,8 +251,8 @@ def privacy_setting():
 def delete_account():
     form = DeleteAccountForm()
     if form.validate_on_submit():
-        db.session.delete(current_user._get_current_object())
-        db.session.commit()
+        delete_user_account(current_user._get_current_object())
+        logout_user()
         flash('You are free, goodbye!', 'success')
         return redirect(url_for('main.index'))
     return render_template('user/settings/delete_account.html', form=form)
\ No newline at end of file
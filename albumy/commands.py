@@ -33,4 +33,140 @@ def cli_commands(app):
         fake_user(30)
         click.echo('Generating %d photos...' % photo)
         fake_photo(photo)
+        click.echo('Done.')
+
+
+    @app.cli.command()
+    @click.option('--workers', default=2, help='Quantity of worker processes, default is 2.')
+    @click.option('--batch-size', default=30, help='Photos fetched per round, default is 30.')
+    @click.option('--interval', default=2.0, help='Seconds to wait when there is nothing to do, default is 2.')
+    @click.option('--once', is_flag=True, help='Exit when no photo is waiting.')
+    def thumbnails(workers, batch_size, interval, once):
+        """Generate thumbnails for photos waiting in processing state."""
+
+        from albumy.jobs import run_thumbnail_worker
+
+        click.echo('Thumbnail worker started.')
+        run_thumbnail_worker(workers=workers, batch_size=batch_size, interval=interval, once=once, echo=click.echo)
+
+
+    @app.cli.command()
+    def recount():
+        """Rebuild the cached counter columns."""
+
+        from albumy.counters import recount_photos, recount_tags, recount_users
+
+        click.echo('Recounting photos...')
+        click.echo('%d photos updated.' % recount_photos())
+        click.echo('Recounting users...')
+        click.echo('%d users updated.' % recount_users())
+        click.echo('Recounting tags...')
+        click.echo('%d tags updated.' % recount_tags())
+        db.session.commit()
+        click.echo('Done.')
+
+
+    @app.cli.group()
+    def notifications():
+        """Notification maintenance commands."""
+
+
+    @notifications.command()
+    @click.option('--days', default=app.config['ALBUMY_NOTIFICATION_RETENTION_DAYS'], help='Delete read notifications older than this many days.')
+    @click.option('--keep', default=app.config['ALBUMY_NOTIFICATION_KEEP'], help='Notifications kept per user, 0 for no limit.')
+    @click.option('--batch-size', default=1000, help='Rows deleted per transaction, default is 1000.')
+    @click.option('--dry-run', is_flag=True, help='Only report the rows that would be deleted.')
+    def compact(days, keep, batch_size, dry_run):
+        """Delete old read notifications."""
+
+        from albumy.notifications import compact_notifications
+
+        result = compact_notifications(days, keep=keep, batch_size=batch_size, dry_run=dry_run)
+        prefix = 'Would delete' if dry_run else 'Deleted'
+        click.echo('%s %d read notifications older than %d days.' % (prefix, result['expired'], days))
+        click.echo('%s %d read notifications over the limit of %d per user.' % (prefix, result['over_cap'], keep))
+
+
+    @app.cli.group()
+    def tags():
+        """Tag maintenance commands."""
+
+
+    @tags.command()
+    def gc():
+        """Delete tags that no photo uses."""
+
+        from albumy.tags import delete_orphan_tags
+
+        click.echo('%d orphan tags deleted.' % delete_orphan_tags())
+        db.session.commit()
+
+
+    @app.cli.group()
+    def deletions():
+        """Pending deletion commands."""
+
+
+    @deletions.command()
+    @click.option('--batch-size', default=app.config['ALBUMY_DELETION_BATCH_SIZE'], help='Rows deleted per transaction.')
+    def sweep(batch_size):
+        """Delete queued accounts and files."""
+
+        from albumy.deletion import sweep_pending_deletions
+
+        users, files = sweep_pending_deletions(batch_size)
+        click.echo('%d accounts and %d files deleted.' % (users, files))
+
+
+    @app.cli.group()
+    def derivatives():
+        """Image derivative cache commands."""
+
+
+    @derivatives.command()
+    def evict():
+        """Evict least recently used derivatives over the cache size."""
+
+        from albumy.derivatives import evict_derivatives
+
+        removed = evict_derivatives(app.config['ALBUMY_DERIVATIVE_PATH'], app.config['ALBUMY_DERIVATIVE_CACHE_SIZE'])
+        click.echo('%d derivatives evicted.' % removed)
+
+
+    @app.cli.group()
+    def stats():
+        """Dashboard statistics commands."""
+
+
+    @stats.command()
+    @click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='Recount from this day, default is the last rolled up day.')
+    def rollup(since):
+        """Roll up daily statistics."""
+
+        from albumy.stats import rollup_daily_stats
+
+        days = rollup_daily_stats(since.date() if since else None)
+        db.session.commit()
+        click.echo('%d days rolled up.' % days)
+
+
+    @app.cli.command()
+    def trending():
+        """Recompute the cached trending tags."""
+
+        from albumy.trending import refresh_trending_tags
+
+        for tag in refresh_trending_tags():
+            click.echo('%s %d' % (tag.name, tag.photo_count))
+
+
+    @app.cli.command()
+    def timeline():
+        """Rebuild the home timelines used by ALBUMY_FEED_MODE=push."""
+
+        from albumy.feeds import rebuild_timelines
+
+        click.echo('Rebuilding timelines...')
+        click.echo('%d entries created.' % rebuild_timelines())
+        db.session.commit()
         click.echo('Done.')
\ No newline at end of file
@@ -0,0 +1,69 @@
+import uuid
+from collections import namedtuple
+
+from flask import current_app
+from flask_sqlalchemy import Pagination
+
+from albumy.extensions import cache, cache_is_shared
+from albumy.loaders import COMMENT_LIST
+from albumy.models import Comment
+
+
+VERSION_KEY = 'albumy:comment-version:%d'
+PAGE_KEY = 'albumy:comments:%d:%s:%d:%d'
+
+CommentAuthor = namedtuple('CommentAuthor', ['id', 'username', 'name', 'avatar_s'])
+RepliedComment = namedtuple('RepliedComment', ['id', 'author'])
+CommentItem = namedtuple('CommentItem', ['id', 'body', 'timestamp', 'author', 'replied'])
+
+'''
+照片详情页的评论分页。一页评论连同评论作者、被回复的评论及其作者用一条查询加载（loaders.COMMENT_LIST），
+总数直接使用Photo.comment_count，不再执行count查询。
+结果转换成只包含模板所需字段的元组，按(照片, 页码)保存在缓存中，超时ALBUMY_COMMENT_CACHE_TIMEOUT秒。
+缓存键中包含每张照片的版本号，新增、删除评论后调用invalidate_comments()更换版本号，这张照片所有页的缓存同时失效。
+版本号必须在所有工作进程中同时更换，所以只有配置了共享的缓存后端时才缓存；SimpleCache、NullCache时每次都查询数据库。
+'''
+def _author(user):
+    return CommentAuthor(user.id, user.username, user.name, user.avatar_s)
+
+
+def _item(comment):
+    replied = None
+    if comment.replied is not None:
+        replied = RepliedComment(comment.replied.id, _author(comment.replied.author))
+    return CommentItem(comment.id, comment.body, comment.timestamp, _author(comment.author), replied)
+
+
+def load_comments(photo_id, page, per_page):
+    comments = Comment.query.options(*COMMENT_LIST) \
+                    .filter(Comment.photo_id == photo_id) \
+                    .order_by(Comment.timestamp.asc(), Comment.id.asc()) \
+                    .offset((page - 1) * per_page).limit(per_page)
+    return [_item(comment) for comment in comments]
+
+
+def _version(photo_id):
+    version = cache.get(VERSION_KEY % photo_id)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(VERSION_KEY % photo_id, version, timeout=0)
+    return version
+
+
+def comment_page(photo, page, per_page):
+    page = max(page, 1)
+    timeout = current_app.config['ALBUMY_COMMENT_CACHE_TIMEOUT']
+    if not timeout or not cache_is_shared():
+        items = load_comments(photo.id, page, per_page)
+    else:
+        key = PAGE_KEY % (photo.id, _version(photo.id), per_page, page)
+        items = cache.get(key)
+        if items is None:
+            items = load_comments(photo.id, page, per_page)
+            cache.set(key, items, timeout=timeout)
+    return Pagination(None, page, per_page, photo.comment_count or 0, items)
+
+
+# 照片的评论有增删后调用
+def invalidate_comments(photo_id):
+    cache.delete(VERSION_KEY % photo_id)
@@ -0,0 +1,52 @@
+from sqlalchemy import func, select
+
+from albumy.extensions import db
+from albumy.models import Collect, Comment, Follow, Notification, Photo, Tag, User, tagging
+
+
+# 照片卡片上的收藏数、评论数，供模板按照片查询。计数直接读取Photo上的计数缓存字段，不需要额外查询
+class PhotoCounter:
+
+    def collect_count(self, photo):
+        return photo.collect_count
+
+    def comment_count(self, photo):
+        return photo.comment_count
+
+
+def _count(column, key, *criteria):
+    return select(func.count()).where(column == key, *criteria).scalar_subquery()
+
+
+# 使用关联子查询的UPDATE语句重建计数缓存字段，ids为None时重建全部记录，否则只重建指定id的记录
+def _recount(model, values, ids=None):
+    statement = model.__table__.update().values(**values)
+    if ids is not None:
+        ids = set(ids)
+        if not ids:
+            return 0
+        statement = statement.where(model.id.in_(ids))
+    return db.session.execute(statement).rowcount
+
+
+def recount_photos(ids=None):
+    return _recount(Photo, {
+        'collect_count': _count(Collect.collected_id, Photo.id),
+        'comment_count': _count(Comment.photo_id, Photo.id)
+    }, ids)
+
+
+def recount_users(ids=None):
+    return _recount(User, {
+        'photo_count': _count(Photo.author_id, User.id),
+        'collection_count': _count(Collect.collector_id, User.id),
+        'follower_count': _count(Follow.followed_id, User.id),
+        'following_count': _count(Follow.follower_id, User.id),
+        'unread_notification_count': _count(Notification.receiver_id, User.id, Notification.is_read == False)
+    }, ids)
+
+
+def recount_tags(ids=None):
+    return _recount(Tag, {
+        'photo_count': _count(tagging.c.tag_id, Tag.id)
+    }, ids)
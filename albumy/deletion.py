@@ -0,0 +1,219 @@
+import os
+import threading
+
+from flask import current_app
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import aliased
+
+from albumy import feeds
+from albumy.comments import invalidate_comments
+from albumy.counters import recount_photos, recount_tags, recount_users
+from albumy.derivatives import remove_derivatives
+from albumy.extensions import db
+from albumy.models import Collect, Comment, Follow, Notification, PendingDeletion, Photo, Timeline, User, \
+    queue_files, tagging
+from albumy.trending import record_tag_changes
+from albumy.usercache import invalidate_user
+
+
+'''
+照片和账户的删除。原来通过ORM的cascade='all'删除，会把用户的全部照片、评论、收藏、通知加载到会话中逐条删除，
+并在事务中同步删除文件。现在：
+    关联记录用DELETE ... WHERE分批删除，每批最多ALBUMY_DELETION_BATCH_SIZE条并单独提交，
+    同一个事务中用关联子查询重建这一批记录涉及的计数字段，中途失败时已经提交的部分计数也是正确的；
+    需要删除的文件写入PendingDeletion表，提交之后由清理任务删除；
+    删除账户时请求中只封禁账户并写入一条kind为user的PendingDeletion记录，账户的数据由清理任务在后台删除。
+清理任务在提交后由start_sweeper()在后台线程中执行（ALBUMY_DELETION_ASYNC为False时在当前请求中执行），
+也可以由定时任务执行flask deletions sweep处理遗留的记录。
+'''
+_lock = threading.Lock()
+_running = False
+_again = False
+
+
+# 分批删除满足条件的记录：每次查询batch_size条记录的主键（以及extra中的列），按主键删除后调用after(rows)，然后提交
+def _delete_in_batches(table, keys, criteria, batch_size, after=None, extra=()):
+    total = 0
+    while True:
+        rows = db.session.execute(select(*keys, *extra).where(*criteria).limit(batch_size)).all()
+        if not rows:
+            return total
+        if len(keys) == 1:
+            condition = keys[0].in_([row[0] for row in rows])
+        else:
+            condition = tuple_(*keys).in_([tuple(row[:len(keys)]) for row in rows])
+        total += db.session.execute(table.delete().where(condition)).rowcount
+        if after is not None:
+            after(rows)
+        db.session.commit()
+
+
+# 删除一组评论及其全部回复：每批只删除没有回复的评论，避免外键引用尚未删除的回复
+def _delete_comments(criteria, batch_size, after=None):
+    reply = aliased(Comment)
+    has_replies = select(reply.id).where(reply.replied_id == Comment.id).exists()
+    return _delete_in_batches(Comment.__table__, (Comment.id,), [*criteria, ~has_replies], batch_size,
+                              after=after, extra=(Comment.photo_id,))
+
+
+def _batch_size(batch_size):
+    return batch_size or current_app.config['ALBUMY_DELETION_BATCH_SIZE']
+
+
+def _delete_photo_batch(ids, batch_size):
+    _delete_in_batches(Collect.__table__, (Collect.collector_id, Collect.collected_id), [Collect.collected_id.in_(ids)],
+                       batch_size, after=lambda rows: recount_users({row[0] for row in rows}))
+    _delete_in_batches(Timeline.__table__, (Timeline.user_id, Timeline.photo_id), [Timeline.photo_id.in_(ids)], batch_size)
+    _delete_comments([Comment.photo_id.in_(ids)], batch_size)
+
+    tag_ids = [row[0] for row in db.session.execute(select(tagging.c.tag_id).where(tagging.c.photo_id.in_(ids)))]
+    photos = db.session.query(Photo.author_id, Photo.filename, Photo.filename_s, Photo.filename_m) \
+                .filter(Photo.id.in_(ids)).all()
+    db.session.execute(tagging.delete().where(tagging.c.photo_id.in_(ids)))
+    db.session.execute(Photo.__table__.delete().where(Photo.id.in_(ids)))
+    connection = db.session.connection()
+    for photo in photos:
+        queue_files(connection, 'upload', photo[1:])
+    recount_users({photo.author_id for photo in photos})
+    recount_tags(tag_ids)
+    record_tag_changes(len(tag_ids))
+    db.session.commit()
+    return len(photos)
+
+
+# 删除一组照片及其标签关联、收藏、评论和时间线记录，照片文件在提交后由清理任务删除。返回删除的照片数量
+def delete_photos(photo_ids, batch_size=None):
+    batch_size = _batch_size(batch_size)
+    photo_ids = list(photo_ids)
+    deleted = 0
+    for start in range(0, len(photo_ids), batch_size):
+        deleted += _delete_photo_batch(photo_ids[start:start + batch_size], batch_size)
+    start_sweeper()
+    return deleted
+
+
+# 关注者数量因为删除账户降回上限时，在这一批提交之后给所有关注者补齐该用户的照片，与feeds.prune()一致
+def _refill_timelines(user_ids):
+    if current_app.config['ALBUMY_FEED_MODE'] != 'push' or not user_ids:
+        return
+    limit = current_app.config['ALBUMY_FEED_FANOUT_LIMIT']
+    for user_id, in db.session.query(User.id).filter(User.id.in_(user_ids), User.follower_count == limit):
+        feeds.schedule_refill(db.session, user_id)
+
+
+def _after_comments(rows):
+    photo_ids = {row.photo_id for row in rows}
+    recount_photos(photo_ids)
+    for photo_id in photo_ids:
+        invalidate_comments(photo_id)
+
+
+def _after_unfollow(rows):
+    followed_ids = {row.followed_id for row in rows}
+    recount_users(followed_ids | {row.follower_id for row in rows})
+    _refill_timelines(followed_ids)
+
+
+# 删除账户的全部数据，可以重复执行：中途失败后再次执行会从剩余的记录继续
+def purge_user(user_id, batch_size=None):
+    batch_size = _batch_size(batch_size)
+    while True:
+        ids = [row[0] for row in db.session.query(Photo.id).filter(Photo.author_id == user_id).limit(batch_size)]
+        if not ids:
+            break
+        _delete_photo_batch(ids, batch_size)
+
+    # 用户在其他照片下的评论，以及其他用户对这些评论的回复。递归CTE作为子查询放在每一批的条件中，
+    # 不把整棵回复树的id加载出来再作为绑定参数（评论很多时会超出SQLite的参数数量上限）
+    subtree = select(Comment.id).where(Comment.author_id == user_id).cte(recursive=True)
+    subtree = subtree.union_all(select(Comment.id).where(Comment.replied_id == subtree.c.id))
+    _delete_comments([Comment.id.in_(select(subtree.c.id))], batch_size, after=_after_comments)
+
+    _delete_in_batches(Collect.__table__, (Collect.collector_id, Collect.collected_id), [Collect.collector_id == user_id],
+                       batch_size, after=lambda rows: recount_photos({row.collected_id for row in rows}))
+    for criterion in (Follow.follower_id == user_id, Follow.followed_id == user_id):
+        _delete_in_batches(Follow.__table__, (Follow.follower_id, Follow.followed_id), [criterion],
+                           batch_size, after=_after_unfollow)
+    _delete_in_batches(Timeline.__table__, (Timeline.user_id, Timeline.photo_id), [Timeline.user_id == user_id], batch_size)
+    _delete_in_batches(Notification.__table__, (Notification.id,), [Notification.receiver_id == user_id], batch_size)
+
+    user = db.session.query(User.avatar_s, User.avatar_m, User.avatar_l, User.avatar_raw).filter(User.id == user_id).first()
+    if user is not None:
+        queue_files(db.session.connection(), 'avatar', user)
+        db.session.execute(User.__table__.delete().where(User.id == user_id))
+    db.session.commit()
+    invalidate_user(user_id)
+
+
+# 注销账户：请求中只封禁账户并记录待删除，账户的数据在后台删除
+def delete_account(user):
+    user.active = False
+    db.session.add(PendingDeletion(kind='user', target=str(user.id)))
+    db.session.commit()
+    start_sweeper()
+
+
+def _remove_file(entry, config):
+    directory = config['ALBUMY_UPLOAD_PATH'] if entry.kind == 'upload' else config['AVATARS_SAVE_PATH']
+    # 多个进程的清理线程可能同时处理同一条记录
+    try:
+        os.remove(os.path.join(directory, entry.target))
+    except FileNotFoundError:
+        pass
+    if entry.kind == 'upload':
+        remove_derivatives(entry.target, config)
+
+
+# 处理PendingDeletion中的记录：先删除账户的数据（会产生新的待删除文件），再删除文件。返回(账户数, 文件数)
+def sweep_pending_deletions(batch_size=None):
+    batch_size = _batch_size(batch_size)
+    config = current_app.config
+    users = files = 0
+    while True:
+        entries = PendingDeletion.query.order_by(PendingDeletion.id).limit(batch_size).all()
+        if not entries:
+            return users, files
+        for entry in entries:
+            if entry.kind == 'user':
+                purge_user(int(entry.target), batch_size)
+                users += 1
+            else:
+                _remove_file(entry, config)
+                files += 1
+        PendingDeletion.query.filter(PendingDeletion.id.in_([entry.id for entry in entries])) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+
+
+def _sweep_in_context(app):
+    global _running, _again
+    with app.app_context():
+        while True:
+            try:
+                sweep_pending_deletions()
+            except Exception:
+                app.logger.exception('Failed to process pending deletions.')
+                db.session.rollback()
+            finally:
+                db.session.remove()
+            with _lock:
+                if not _again:
+                    _running = False
+                    return
+                _again = False
+
+
+# 在后台线程中处理待删除的记录，同一个进程中只有一个清理线程，运行期间的新请求在本轮结束后再处理一轮
+def start_sweeper():
+    global _running, _again
+    app = current_app._get_current_object()
+    if not app.config['ALBUMY_DELETION_ASYNC']:
+        return sweep_pending_deletions()
+    with _lock:
+        if _running:
+            _again = True
+            return None
+        _running = True
+    thr = threading.Thread(target=_sweep_in_context, args=[app], daemon=True)
+    thr.start()
+    return thr
@@ -0,0 +1,167 @@
+import os
+import tempfile
+import threading
+import time
+
+from flask import current_app, abort
+from PIL import Image, UnidentifiedImageError
+from werkzeug.security import safe_join
+
+try:
+    import fcntl
+except ImportError:  # Windows下不加锁
+    fcntl = None
+
+
+'''
+按需生成的照片衍生尺寸：/uploads/<preset>/<filename>第一次被访问时，按ALBUMY_PHOTO_PRESETS中的宽度从原图生成，
+保存在ALBUMY_DERIVATIVE_PATH/<preset>/目录下，之后直接从磁盘读取。
+同一个文件的并发生成通过文件锁串行化；缓存目录超过ALBUMY_DERIVATIVE_CACHE_SIZE时，按最近访问时间淘汰最旧的文件。
+最近访问时间记录在文件的atime上，mtime保持为生成时间，ETag和Last-Modified不会因为访问而改变。
+淘汰需要遍历整个缓存目录，所以每个进程在内存中记录目录大小的估计值（上一次遍历的结果加上之后本进程生成的文件），
+只有估计值超过上限时才遍历；其他进程生成的文件不计入估计值，可以由定时任务执行flask derivatives evict。
+'''
+_lock = threading.Lock()
+_cache_size = None # 本进程估计的缓存目录大小，None表示还没有遍历过
+
+class _FileLock:
+
+    def __init__(self, path, blocking=True):
+        self.path = path
+        self.blocking = blocking
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        if fcntl is None:
+            return True
+        flags = fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(self.file.fileno(), flags)
+        except (IOError, OSError):
+            return False
+        return True
+
+    def __exit__(self, *args):
+        self.file.close()
+
+
+def _resize(source, target, width):
+    with Image.open(source) as img:
+        if img.size[0] <= width:
+            resized = img.copy()
+        else:
+            height = int(float(img.size[1]) * (width / float(img.size[0])))
+            img.draft(img.mode, (width, height))
+            resized = img.resize((width, height), Image.LANCZOS)
+        image_format = img.format
+    # 先写入临时文件再重命名，其他进程不会读到写了一半的文件
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            resized.save(f, format=image_format)
+        os.replace(tmp, target)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
+# 缓存目录超出容量时删除最久未访问的文件，直到容量降到上限的90%；同一时间只有一个进程执行淘汰。keep是刚生成、马上要返回的文件
+def evict_derivatives(root, max_size, keep=None):
+    global _cache_size
+    os.makedirs(root, exist_ok=True)
+    with _FileLock(os.path.join(root, '.evict.lock'), blocking=False) as locked:
+        if not locked:
+            return 0
+        entries = []
+        total = 0
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if filename.startswith('.') or filename.endswith(('.lock', '.tmp')) or path == keep:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+                total += stat.st_size
+        if keep is not None and os.path.exists(keep):
+            total += os.path.getsize(keep)
+        if total <= max_size:
+            with _lock:
+                _cache_size = total
+            return 0
+
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            if total <= max_size * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with _lock:
+            _cache_size = total
+        return removed
+
+
+# 记录本进程新生成的文件，估计值超过上限时才遍历目录执行淘汰
+def _record_derivative(target):
+    global _cache_size
+    max_size = current_app.config['ALBUMY_DERIVATIVE_CACHE_SIZE']
+    with _lock:
+        if _cache_size is not None:
+            _cache_size += os.path.getsize(target)
+            if _cache_size <= max_size:
+                return 0
+    return evict_derivatives(current_app.config['ALBUMY_DERIVATIVE_PATH'], max_size, keep=target)
+
+
+# 返回衍生文件所在目录，文件不存在时生成
+def get_derivative(preset, filename):
+    presets = current_app.config['ALBUMY_PHOTO_PRESETS']
+    if preset not in presets:
+        abort(404)
+    source = safe_join(current_app.config['ALBUMY_UPLOAD_PATH'], filename)
+    if source is None or not os.path.isfile(source):
+        abort(404)
+
+    directory = os.path.join(current_app.config['ALBUMY_DERIVATIVE_PATH'], preset)
+    target = os.path.join(directory, filename)
+    if os.path.exists(target):
+        # 更新访问时间，作为淘汰时的最近访问时间（文件系统以noatime挂载时也有效）
+        os.utime(target, (time.time(), os.stat(target).st_mtime))
+        return directory
+
+    os.makedirs(directory, exist_ok=True)
+    lock_path = target + '.lock'
+    with _FileLock(lock_path):
+        # 获得锁之后再检查一次，其他进程可能已经生成了同一个文件
+        generated = False
+        if not os.path.exists(target):
+            try:
+                _resize(source, target, presets[preset])
+            except UnidentifiedImageError:
+                # 上传目录中不是图片的文件
+                abort(404)
+            generated = True
+    try:
+        os.remove(lock_path)
+    except OSError:
+        pass
+
+    if generated:
+        _record_derivative(target)
+    return directory
+
+
+# 删除某张照片的全部衍生文件
+def remove_derivatives(filename, config):
+    for preset in config['ALBUMY_PHOTO_PRESETS']:
+        try:
+            os.remove(os.path.join(config['ALBUMY_DERIVATIVE_PATH'], preset, filename))
+        except FileNotFoundError:
+            pass
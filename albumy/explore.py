@@ -0,0 +1,101 @@
+import random
+
+from flask import current_app
+
+from albumy.extensions import db, cache
+from albumy.models import Photo
+
+
+ID_RANGE_KEY = 'albumy:explore-id-range'
+POOL_KEY = 'albumy:explore-pool'
+
+'''
+探索页的随机照片。ORDER BY RANDOM()需要扫描并排序整张照片表，这里改为在主键范围内随机取id：
+每轮生成一批随机id，用一次主键IN查询找出实际存在的照片，已删除照片留下的空洞通过下一轮补足，
+多轮之后仍然不够（id非常稀疏）时，用id >= 随机值的索引查找补齐。每次请求的查询数与照片总数无关。
+主键范围缓存ALBUMY_EXPLORE_CACHE_TIMEOUT秒，新上传的照片最晚在这之后出现在探索页。
+设置ALBUMY_EXPLORE_POOL_SIZE后，还会在缓存中保存一个预先抽取的id池，每次请求从池中随机挑选，池按同样的时间刷新。
+池中可能有刷新之后被删除的照片，缺少的数量再按id随机抽取补足。
+'''
+def _id_range():
+    id_range = cache.get(ID_RANGE_KEY)
+    if id_range is None:
+        id_range = db.session.query(db.func.min(Photo.id), db.func.max(Photo.id)).one()
+        id_range = tuple(id_range)
+        cache.set(ID_RANGE_KEY, id_range, timeout=current_app.config['ALBUMY_EXPLORE_CACHE_TIMEOUT'])
+    return id_range
+
+
+# 在主键范围内随机抽取k个存在的照片id
+def random_photo_ids(k, rounds=4):
+    low, high = _id_range()
+    if low is None:
+        return []
+    span = high - low + 1
+    if span <= k:
+        ids = [row[0] for row in db.session.query(Photo.id)]
+        random.shuffle(ids)
+        return ids[:k]
+
+    found = []
+    tried = set()
+    for _ in range(rounds):
+        need = k - len(found)
+        if need <= 0:
+            break
+        # 多取一些候选id，抵消已删除照片造成的空洞
+        candidates = set()
+        for _ in range(min(need * 2, span - len(tried))):
+            candidate = random.randint(low, high)
+            if candidate not in tried:
+                candidates.add(candidate)
+        if not candidates:
+            break
+        tried.update(candidates)
+        rows = db.session.query(Photo.id).filter(Photo.id.in_(candidates))
+        found.extend(row[0] for row in rows)
+    random.shuffle(found)
+    found = found[:k]
+
+    picked = set(found)
+    for _ in range(k - len(found)):
+        row = db.session.query(Photo.id) \
+                .filter(Photo.id >= random.randint(low, high), ~Photo.id.in_(picked)) \
+                .order_by(Photo.id).first()
+        if row is None:
+            row = db.session.query(Photo.id).filter(~Photo.id.in_(picked)).order_by(Photo.id).first()
+        if row is None:
+            break
+        found.append(row[0])
+        picked.add(row[0])
+    return found
+
+
+def _pool():
+    pool = cache.get(POOL_KEY)
+    if pool is None:
+        pool = random_photo_ids(current_app.config['ALBUMY_EXPLORE_POOL_SIZE'])
+        cache.set(POOL_KEY, pool, timeout=current_app.config['ALBUMY_EXPLORE_CACHE_TIMEOUT'])
+    return pool
+
+
+def _load_photos(ids):
+    if not ids:
+        return []
+    photos = {photo.id: photo for photo in Photo.query.filter(Photo.id.in_(ids))}
+    return [photos[id] for id in ids if id in photos]
+
+
+# 返回k张随机照片
+def explore_photos(k):
+    if not current_app.config['ALBUMY_EXPLORE_POOL_SIZE']:
+        return _load_photos(random_photo_ids(k))
+
+    pool = _pool()
+    photos = _load_photos(random.sample(pool, min(k, len(pool))))
+    missing = k - len(photos)
+    if missing > 0:
+        picked = {photo.id for photo in photos}
+        ids = [id for id in random_photo_ids(missing + len(picked)) if id not in picked]
+        photos.extend(_load_photos(ids[:missing]))
+    return photos
@@ -7,6 +7,8 @@ from flask_moment import Moment
 from flask_dropzone import Dropzone
 from flask_avatars import Avatars
 from flask_wtf import CSRFProtect
+from flask_caching import Cache
+from flask_caching.backends import NullCache, SimpleCache
 
 
 db = SQLAlchemy()
@@ -18,13 +20,19 @@ moment = Moment()
 dropzone = Dropzone()
 avatars = Avatars()
 csrf = CSRFProtect()
+cache = Cache()
+
+
+# 缓存后端是否在多个工作进程之间共享。SimpleCache、NullCache只在当前进程中有效，
+# 需要在所有进程中同时失效的数据不能只依赖它们
+def cache_is_shared():
+    return not isinstance(cache.cache, (SimpleCache, NullCache))
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    from albumy.models import User
-    user = User.query.get(int(user_id))
-    return user
+    from albumy.usercache import load_cached_user
+    return load_cached_user(int(user_id))
 
 
 # 设置登录视图的端点及信息分类
@@ -0,0 +1,184 @@
+import threading
+
+from flask import current_app, has_app_context
+from sqlalchemy import select, literal, or_
+
+from albumy.extensions import db
+from albumy.pagination import cursor_paginate
+
+
+'''
+首页动态。ALBUMY_FEED_MODE为pull时，每次请求把照片表与关注表连接后排序（原来的做法）；
+为push时，上传照片的同时把照片写入每个关注者的时间线（Timeline表），首页只读取当前用户自己的时间线：
+    关注某人时，把对方最近ALBUMY_FEED_BACKFILL张照片补进时间线，取消关注时删除对方的全部记录；
+    关注者超过ALBUMY_FEED_FANOUT_LIMIT的用户上传照片时不写入时间线，由关注者在读取时直接从照片表中拉取；
+    关注者数量降回上限以内时，给所有关注者补齐该用户最近的照片。
+时间线的写入在模型事件中、与照片和关注记录的修改在同一个事务中执行。从pull切换到push后需要执行flask timeline重建时间线。
+补齐照片最多要写入ALBUMY_FEED_FANOUT_LIMIT * ALBUMY_FEED_BACKFILL条记录，不在取消关注的请求中执行：
+事务中只通过schedule_refill()记录作者，提交之后在后台线程中补齐（ALBUMY_FEED_REFILL_ASYNC为False时在提交后直接执行）。
+进程在补齐之前退出时，这些关注者的时间线会缺少该作者的照片，直到执行flask timeline。
+'''
+def _push_enabled():
+    return has_app_context() and current_app.config['ALBUMY_FEED_MODE'] == 'push'
+
+
+def _is_big(connection, user_id):
+    from albumy.models import User
+
+    follower_count = connection.execute(select(User.follower_count).where(User.id == user_id)).scalar()
+    return (follower_count or 0) > current_app.config['ALBUMY_FEED_FANOUT_LIMIT']
+
+
+def _insert_entries(connection, query):
+    from albumy.models import Timeline
+
+    table = Timeline.__table__
+    return connection.execute(table.insert().from_select(['user_id', 'photo_id', 'author_id', 'timestamp'], query)).rowcount
+
+
+# 作者最近的n张照片
+def _recent_photos(author_id, n):
+    from albumy.models import Photo
+
+    return select(Photo.id, Photo.author_id, Photo.timestamp) \
+            .where(Photo.author_id == author_id) \
+            .order_by(Photo.timestamp.desc()).limit(n).subquery()
+
+
+# 新照片写入作者所有关注者的时间线
+def fan_out(connection, photo):
+    from albumy.models import Follow
+
+    if not _push_enabled() or _is_big(connection, photo.author_id):
+        return 0
+    query = select(Follow.follower_id, literal(photo.id), literal(photo.author_id), literal(photo.timestamp)) \
+                .where(Follow.followed_id == photo.author_id)
+    return _insert_entries(connection, query)
+
+
+def backfill(connection, follower_id, followed_id):
+    if not _push_enabled() or _is_big(connection, followed_id):
+        return 0
+    recent = _recent_photos(followed_id, current_app.config['ALBUMY_FEED_BACKFILL'])
+    query = select(literal(follower_id), recent.c.id, recent.c.author_id, recent.c.timestamp)
+    return _insert_entries(connection, query)
+
+
+# 把作者最近的照片写入所有关注者的时间线，跳过已有的记录
+def fill_author(connection, author_id):
+    from albumy.models import Follow, Timeline
+
+    recent = _recent_photos(author_id, current_app.config['ALBUMY_FEED_BACKFILL'])
+    exists = select(Timeline.photo_id) \
+                .where(Timeline.user_id == Follow.follower_id, Timeline.photo_id == recent.c.id) \
+                .exists()
+    query = select(Follow.follower_id, recent.c.id, recent.c.author_id, recent.c.timestamp) \
+                .join_from(Follow, recent, recent.c.author_id == Follow.followed_id) \
+                .where(~exists)
+    return _insert_entries(connection, query)
+
+
+def prune(connection, follower_id, followed_id, session=None):
+    from albumy.models import Timeline, User
+
+    if not _push_enabled():
+        return 0
+    table = Timeline.__table__
+    deleted = connection.execute(table.delete().where(table.c.user_id == follower_id, table.c.author_id == followed_id)).rowcount
+    # 关注者数量刚好降到上限：之前按大V处理、没有写入时间线的照片需要补上
+    follower_count = connection.execute(select(User.follower_count).where(User.id == followed_id)).scalar()
+    if follower_count == current_app.config['ALBUMY_FEED_FANOUT_LIMIT']:
+        schedule_refill(session, followed_id)
+    return deleted
+
+
+# 记录需要给所有关注者补齐照片的作者，在会话提交之后执行；没有会话时直接执行
+def schedule_refill(session, author_id):
+    if session is None:
+        return refill_authors([author_id])
+    session.info.setdefault('albumy_timeline_refill', set()).add(author_id)
+    return 0
+
+
+# 每个作者单独一个事务补齐，执行时作者的关注者又超过上限的跳过
+def refill_authors(author_ids):
+    total = 0
+    for author_id in author_ids:
+        with db.engine.begin() as connection:
+            if not _is_big(connection, author_id):
+                total += fill_author(connection, author_id)
+    return total
+
+
+def _refill_in_context(app, author_ids):
+    with app.app_context():
+        try:
+            refill_authors(author_ids)
+        except Exception:
+            app.logger.exception('Failed to refill timelines of %s.', sorted(author_ids))
+
+
+@db.event.listens_for(db.Session, 'after_commit')
+def start_refill(session):
+    author_ids = session.info.pop('albumy_timeline_refill', None)
+    if not author_ids:
+        return None
+    app = current_app._get_current_object()
+    if not app.config['ALBUMY_FEED_REFILL_ASYNC']:
+        return refill_authors(author_ids)
+    thr = threading.Thread(target=_refill_in_context, args=[app, author_ids], daemon=True)
+    thr.start()
+    return thr
+
+
+@db.event.listens_for(db.Session, 'after_rollback')
+def discard_refill(session):
+    session.info.pop('albumy_timeline_refill', None)
+
+
+def remove_photo(connection, photo_id):
+    from albumy.models import Timeline
+
+    if not _push_enabled():
+        return 0
+    table = Timeline.__table__
+    return connection.execute(table.delete().where(table.c.photo_id == photo_id)).rowcount
+
+
+# 重建全部时间线：每个作者一条INSERT ... SELECT，把最近的照片写入所有关注者的时间线，不提交
+def rebuild_timelines():
+    from albumy.models import Timeline, User
+
+    connection = db.session.connection()
+    connection.execute(Timeline.__table__.delete())
+    limit = current_app.config['ALBUMY_FEED_FANOUT_LIMIT']
+    authors = db.session.query(User.id).filter(User.photo_count > 0, User.follower_count <= limit)
+    total = 0
+    for author_id, in authors.all():
+        total += fill_author(connection, author_id)
+    return total
+
+
+# 当前用户首页的照片，按(时间, id)降序游标分页
+def home_feed(user, per_page, options=()):
+    from albumy.models import Follow, Photo, Timeline, User
+
+    if current_app.config['ALBUMY_FEED_MODE'] != 'push':
+        query = Photo.query.options(*options) \
+                    .join(Follow, Follow.followed_id == Photo.author_id) \
+                    .filter(Follow.follower_id == user.id)
+        return cursor_paginate(query, (Photo.timestamp, Photo.id), per_page)
+
+    big = db.session.query(Follow.followed_id) \
+            .join(User, User.id == Follow.followed_id) \
+            .filter(Follow.follower_id == user.id, User.follower_count > current_app.config['ALBUMY_FEED_FANOUT_LIMIT']) \
+            .all()
+    if not big:
+        query = Photo.query.options(*options).join(Timeline, Timeline.photo_id == Photo.id).filter(Timeline.user_id == user.id)
+        return cursor_paginate(query, (Timeline.timestamp, Timeline.photo_id), per_page,
+                               key=lambda photo: (photo.timestamp, photo.id))
+
+    # 关注了大V：时间线中的照片加上这些作者的照片
+    entries = db.session.query(Timeline.photo_id).filter(Timeline.user_id == user.id)
+    query = Photo.query.options(*options).filter(or_(Photo.id.in_(entries), Photo.author_id.in_([row[0] for row in big])))
+    return cursor_paginate(query, (Photo.timestamp, Photo.id), per_page)
@@ -0,0 +1,195 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from functools import partial
+
+from flask import current_app
+
+from albumy.extensions import db
+from albumy.utils import make_thumbnails
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _thumbnail_args(config, filename):
+    path = os.path.join(config['ALBUMY_UPLOAD_PATH'], filename)
+    return path, dict(config['ALBUMY_PHOTO_SUFFIX'])
+
+
+# 缩略图生成完成后更新照片记录，生成失败的尺寸继续使用原图；如果照片在处理期间已被删除，清理刚生成的文件
+def save_thumbnails(photo_id, filename, filenames, config):
+    from albumy.models import Photo
+
+    sizes = config['ALBUMY_PHOTO_SIZE']
+    updated = Photo.query.filter_by(id=photo_id).update({
+        'filename_s': filenames.get(sizes['small'], filename),
+        'filename_m': filenames.get(sizes['medium'], filename),
+        'processing': False
+    }, synchronize_session=False)
+    db.session.commit()
+    if not updated:
+        for thumbnail in set(filenames.values()) - {filename}:
+            path = os.path.join(config['ALBUMY_UPLOAD_PATH'], thumbnail)
+            if os.path.exists(path):
+                os.remove(path)
+    return updated
+
+
+'''
+上传照片的缩略图处理队列，处理方式由ALBUMY_THUMBNAIL_MODE决定：
+    inline：在请求中同步生成；
+    pool：交给本进程持有的进程池生成，排队任务数超过ALBUMY_THUMBNAIL_QUEUE_SIZE时拒绝新的上传；
+    worker：请求中只保存记录，由flask thumbnails命令启动的工作进程从数据库中取出processing状态的照片处理。
+照片记录在提交任务前就已插入，处理完成前filename_s、filename_m指向原图，页面可以正常显示。
+pool模式下进程池中的任务失败或进程池损坏时改为在当前进程中生成；进程重启时丢失的任务在收到第一个请求时重新提交，
+只提交上传时间早于ALBUMY_THUMBNAIL_RETRY_AFTER秒的照片，避免与其他进程中正在处理的任务重复。
+'''
+class ThumbnailQueue:
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ALBUMY_THUMBNAIL_MODE', 'inline')
+        app.config.setdefault('ALBUMY_THUMBNAIL_WORKERS', 2)
+        app.config.setdefault('ALBUMY_THUMBNAIL_QUEUE_SIZE', 60)
+        app.config.setdefault('ALBUMY_THUMBNAIL_RETRY_AFTER', 10 * 60)
+        app.extensions['thumbnail_queue'] = self
+        if app.config['ALBUMY_THUMBNAIL_MODE'] == 'pool':
+            app.before_first_request(self.requeue_stuck)
+
+    def _get_executor(self, app):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=app.config['ALBUMY_THUMBNAIL_WORKERS'])
+        return self._executor
+
+    # 队列是否已满，上传视图在保存文件之前调用，用于拒绝新的上传
+    def is_full(self):
+        from albumy.models import Photo
+
+        mode = current_app.config['ALBUMY_THUMBNAIL_MODE']
+        size = current_app.config['ALBUMY_THUMBNAIL_QUEUE_SIZE']
+        if mode == 'pool':
+            return self._pending >= size
+        if mode == 'worker':
+            return Photo.query.filter_by(processing=True).count() >= size
+        return False
+
+    # 在当前进程中生成缩略图，失败时继续使用原图
+    def generate(self, photo_id, filename):
+        app = current_app._get_current_object()
+        try:
+            filenames = make_thumbnails(*_thumbnail_args(app.config, filename))
+        except Exception:
+            app.logger.exception('Failed to generate thumbnails for photo %s.', photo_id)
+            db.session.rollback()
+            filenames = {}
+        return save_thumbnails(photo_id, filename, filenames, app.config)
+
+    def submit(self, photo):
+        self._submit(current_app._get_current_object(), photo.id, photo.filename)
+
+    def _submit(self, app, photo_id, filename):
+        mode = app.config['ALBUMY_THUMBNAIL_MODE']
+        if mode == 'inline':
+            self.generate(photo_id, filename)
+        elif mode == 'pool':
+            executor = self._get_executor(app)
+            with self._lock:
+                if self._pending >= app.config['ALBUMY_THUMBNAIL_QUEUE_SIZE']:
+                    raise QueueFull()
+                self._pending += 1
+            try:
+                future = executor.submit(make_thumbnails, *_thumbnail_args(app.config, filename))
+            except BrokenProcessPool:
+                # 进程池中的进程意外退出，丢弃进程池，下次提交时重新创建，这张照片在当前请求中生成
+                app.logger.warning('Thumbnail pool is broken, generating photo %s inline.', photo_id)
+                with self._lock:
+                    self._pending -= 1
+                    if self._executor is executor:
+                        self._executor = None
+                self.generate(photo_id, filename)
+                return
+            future.add_done_callback(partial(self._done, app, photo_id, filename))
+
+    # 进程池任务完成后的回调，在进程池的管理线程中执行，需要推送应用上下文
+    def _done(self, app, photo_id, filename, future):
+        try:
+            with app.app_context():
+                try:
+                    save_thumbnails(photo_id, filename, future.result(), app.config)
+                except Exception:
+                    # 进程池中的进程崩溃或生成失败，在当前线程中重新生成一次
+                    app.logger.exception('Thumbnail job for photo %s failed, retrying inline.', photo_id)
+                    db.session.rollback()
+                    self.generate(photo_id, filename)
+                finally:
+                    db.session.remove()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    # 重新提交上传较早但仍处于处理中状态的照片（例如进程重启前还没有处理完的任务），队列满时留到下次启动
+    def requeue_stuck(self):
+        from albumy.models import Photo
+
+        app = current_app._get_current_object()
+        before = datetime.utcnow() - timedelta(seconds=app.config['ALBUMY_THUMBNAIL_RETRY_AFTER'])
+        photos = Photo.query.with_entities(Photo.id, Photo.filename) \
+                    .filter(Photo.processing == True, Photo.timestamp < before) \
+                    .order_by(Photo.id).limit(app.config['ALBUMY_THUMBNAIL_QUEUE_SIZE']).all()
+        db.session.rollback()
+        for photo_id, filename in photos:
+            try:
+                self._submit(app, photo_id, filename)
+            except QueueFull:
+                break
+        return len(photos)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+thumbnail_queue = ThumbnailQueue()
+
+
+# 工作进程：循环取出processing状态的照片，交给进程池生成缩略图
+def run_thumbnail_worker(workers=2, batch_size=30, interval=2, once=False, echo=print):
+    from albumy.models import Photo
+
+    app = current_app._get_current_object()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            photos = Photo.query.with_entities(Photo.id, Photo.filename) \
+                        .filter_by(processing=True).order_by(Photo.id).limit(batch_size).all()
+            db.session.rollback()
+            futures = [
+                (photo_id, filename, executor.submit(make_thumbnails, *_thumbnail_args(app.config, filename)))
+                for photo_id, filename in photos
+            ]
+            for photo_id, filename, future in futures:
+                try:
+                    filenames = future.result()
+                except Exception as e:
+                    echo('Photo %d failed: %s' % (photo_id, e))
+                    filenames = {}
+                save_thumbnails(photo_id, filename, filenames, app.config)
+            if futures:
+                echo('%d photos processed.' % len(futures))
+            if once and not futures:
+                return
+            if not futures:
+                time.sleep(interval)
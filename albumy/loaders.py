@@ -0,0 +1,65 @@
+from sqlalchemy.orm import joinedload, selectinload
+
+from albumy.models import Collect, Comment, Follow, Photo, User
+
+
+'''
+列表视图的关联加载方式集中定义在这里，视图函数通过query.options(*PROFILE)使用。
+模型上的关联关系都是默认的lazy='select'，只有在这里声明的视图才会连带加载，其他地方访问时按需查询。
+列表中的用户只显示头像、用户名和昵称，只加载USER_CARD中的字段；其他字段在第一次访问时才会查询。
+'''
+USER_CARD = ('id', 'username', 'name', 'avatar_s', 'avatar_m')
+
+
+def _user_card(loader):
+    return loader.load_only(*USER_CARD)
+
+
+# 首页动态：照片作者的头像和名称
+PHOTO_LIST = (
+    _user_card(joinedload(Photo.author)),
+)
+
+# 照片详情页：侧边栏中的作者（关注按钮需要完整的用户）和标签
+PHOTO_DETAIL = (
+    joinedload(Photo.author),
+    selectinload(Photo.tags),
+)
+
+# 评论列表：评论作者以及被回复评论的作者
+COMMENT_LIST = (
+    _user_card(joinedload(Comment.author)),
+    _user_card(joinedload(Comment.replied).joinedload(Comment.author)),
+)
+
+# 照片的收藏者、用户的收藏
+COLLECTOR_LIST = (
+    _user_card(joinedload(Collect.collector)),
+)
+
+COLLECTION_LIST = (
+    joinedload(Collect.collected),
+)
+
+# 用户的关注者、用户关注的人
+FOLLOWER_LIST = (
+    _user_card(joinedload(Follow.follower)),
+)
+
+FOLLOWING_LIST = (
+    _user_card(joinedload(Follow.followed)),
+)
+
+# 管理后台
+MANAGE_USER_LIST = (
+    joinedload(User.role),
+)
+
+MANAGE_PHOTO_LIST = (
+    _user_card(joinedload(Photo.author)),
+    selectinload(Photo.tags),
+)
+
+MANAGE_COMMENT_LIST = (
+    _user_card(joinedload(Comment.author)),
+)
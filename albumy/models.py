@@ -1,12 +1,17 @@
-import os
 from datetime import datetime
 
 from flask import current_app
 from flask_login import UserMixin
 from flask_avatars import Identicon
+from sqlalchemy.orm import object_session
 from werkzeug.security import generate_password_hash ,check_password_hash
 
 from albumy.extensions import db
+from albumy.relations import get_relation_state, clear_relations
+from albumy import feeds
+from albumy.trending import record_tag_changes
+from albumy.permissions import invalidate_permissions, role_name, role_permissions
+from albumy.usercache import mark_user_stale
 
 
 roles_permissions = db.Table(
@@ -49,15 +54,17 @@ class Role(db.Model):
                     db.session.add(permission)
                 role.permissions.append(permission)
         db.session.commit()
+        invalidate_permissions()
 
 
 class Collect(db.Model):
     collector_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
     collected_id = db.Column(db.Integer, db.ForeignKey('photo.id'), primary_key=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
-    collector = db.relationship('User', back_populates='collections', lazy='joined')
-    collected = db.relationship('Photo', back_populates='collectors', lazy='joined')
+    # 需要连带加载收藏者、照片的视图使用loaders模块中的加载选项
+    collector = db.relationship('User', back_populates='collections')
+    collected = db.relationship('Photo', back_populates='collectors')
 
 
 class Follow(db.Model):
@@ -65,8 +72,8 @@ class Follow(db.Model):
     followed_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
-    follower = db.relationship('User', foreign_keys=[follower_id], back_populates='following', lazy='joined')
-    followed = db.relationship('User', foreign_keys=[followed_id], back_populates='followers', lazy='joined')
+    follower = db.relationship('User', foreign_keys=[follower_id], back_populates='following')
+    followed = db.relationship('User', foreign_keys=[followed_id], back_populates='followers')
 
 
 class User(db.Model, UserMixin):
@@ -78,7 +85,7 @@ class User(db.Model, UserMixin):
     website = db.Column(db.String(255))
     bio = db.Column(db.String(120))
     location = db.Column(db.String(50))
-    member_since = db.Column(db.DateTime, default=datetime.utcnow)
+    member_since = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     confirmed = db.Column(db.Boolean, default=False)
     locked = db.Column(db.Boolean, default=False) # 锁定状态
     active = db.Column(db.Boolean, default=True) # 封禁状态
@@ -92,6 +99,12 @@ class User(db.Model, UserMixin):
     public_collections = db.Column(db.Boolean, default=True)
     public_followers = db.Column(db.Boolean, default=True)
     public_following = db.Column(db.Boolean, default=True)
+    # 计数缓存字段，由模型事件维护，可通过flask recount命令重建
+    photo_count = db.Column(db.Integer, default=0)
+    collection_count = db.Column(db.Integer, default=0)
+    follower_count = db.Column(db.Integer, default=0)
+    following_count = db.Column(db.Integer, default=0)
+    unread_notification_count = db.Column(db.Integer, default=0)
 
     role_id = db.Column(db.Integer, db.ForeignKey('role.id'))
     
@@ -113,17 +126,16 @@ class User(db.Model, UserMixin):
 
     @property
     def is_admin(self):
-        return self.role.name == 'Administrator'
+        return role_name(self.role_id) == 'Administrator'
     
     # 重写继承自Flask-Login的UserMixin类中的is_active属性，如果user对象的is_active属性值为False，Flask-Login将拒绝用户登录
     @property
     def is_active(self):
         return self.active
 
-    # 用户是否有某种权限
+    # 用户是否有某种权限，权限集合来自按角色缓存的映射，不需要查询数据库
     def can(self, permission_name):
-        permission = Permission.query.filter_by(name=permission_name).first()
-        return  permission is not None and self.role is not None and permission in self.role.permissions
+        return permission_name in role_permissions(self.role_id)
 
     # 为用户设置角色
     def set_role(self):
@@ -178,14 +190,20 @@ class User(db.Model, UserMixin):
             collect = Collect(collector=self, collected=photo)
             db.session.add(collect)
             db.session.commit()
+            clear_relations()
 
     def uncollect(self, photo):
         collect = Collect.query.with_parent(self).filter_by(collected_id=photo.id).first()
         if collect:
             db.session.delete(collect)
             db.session.commit()
+            clear_relations()
             
+    # 如果当前请求已经通过preload_relations()批量加载了收藏状态，直接从内存中判断
     def is_collecting(self, photo):
+        state = get_relation_state(self)
+        if state is not None and photo.id in state.photo_ids:
+            return photo.id in state.collected_ids
         return Collect.query.with_parent(self).filter_by(collected_id=photo.id).first() is not None
 
     # 关注、取消关注、是否关注、是否被关注
@@ -194,21 +212,29 @@ class User(db.Model, UserMixin):
             follow = Follow(follower=self, followed=user)
             db.session.add(follow)
             db.session.commit()
+            clear_relations()
 
     def unfollow(self, user):
         follow = self.following.filter_by(followed_id=user.id).first()
         if follow:
             db.session.delete(follow)
             db.session.commit()
+            clear_relations()
 
     def is_following(self, user):
         # 在构造函数__init__(self, **kwargs)中，设置用户关注自己，seld.follow(self)中调用了self.is_following(self),
         # 此时self还未提交数据库会话，所以self.id为空。所以，需要在is_following()函数中判断一下user.id为None的情况。
         if user.id is None:
             return False
+        state = get_relation_state(self)
+        if state is not None and user.id in state.user_ids:
+            return user.id in state.following_ids
         return self.following.filter_by(followed_id=user.id).first() is not None
 
     def is_followed_by(self, user):
+        state = get_relation_state(self)
+        if state is not None and user.id in state.user_ids:
+            return user.id in state.follower_ids
         return self.followers.filter_by(follower_id=user.id).first() is not None
 
     @classmethod
@@ -220,7 +246,8 @@ class User(db.Model, UserMixin):
 
 tagging = db.Table('tagging',
         db.Column('photo_id', db.Integer, db.ForeignKey('photo.id')),
-        db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'))
+        db.Column('tag_id', db.Integer, db.ForeignKey('tag.id')),
+        db.UniqueConstraint('photo_id', 'tag_id', name='uq_tagging_photo_id_tag_id')
     ) 
 
 
@@ -233,6 +260,9 @@ class Photo(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     can_comment = db.Column(db.Boolean, default=True)
     flag = db.Column(db.Integer, default=0)
+    processing = db.Column(db.Boolean, default=False) # 缩略图是否正在生成
+    collect_count = db.Column(db.Integer, default=0)
+    comment_count = db.Column(db.Integer, default=0)
     author_id = db.Column(db.Integer, db.ForeignKey('user.id'))
 
     author = db.relationship('User', back_populates='photos')
@@ -240,10 +270,30 @@ class Photo(db.Model):
     tags = db.relationship('Tag', secondary=tagging, back_populates='photos')
     collectors = db.relationship('Collect', back_populates='collected', cascade='all')
 
+    # 首页动态和用户主页按作者筛选、按时间排序；照片详情页按作者查找相邻的照片
+    __table_args__ = (
+        db.Index('ix_photo_author_id_timestamp', 'author_id', 'timestamp'),
+        db.Index('ix_photo_author_id_id', 'author_id', 'id'),
+    )
+
+    # 同一作者的上一张（更新的）和下一张（更早的）照片，返回(previous, next)，不存在时为None。
+    # 两个min/max子查询都只在(author_id, id)索引上定位一次，合并成一条查询，只加载id和中等尺寸的文件名
+    def neighbors(self):
+        same_author = Photo.author_id == self.author_id
+        ids = db.union_all(
+            db.select(db.func.min(Photo.id)).where(same_author, Photo.id > self.id),
+            db.select(db.func.max(Photo.id)).where(same_author, Photo.id < self.id)
+        )
+        photos = Photo.query.options(db.load_only('id', 'filename_m')).filter(Photo.id.in_(ids)).all()
+        previous = next((photo for photo in photos if photo.id > self.id), None)
+        following = next((photo for photo in photos if photo.id < self.id), None)
+        return previous, following
+
 
 class Tag(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), unique=True)
+    photo_count = db.Column(db.Integer, default=0)
 
     photos = db.relationship('Photo', secondary=tagging, back_populates='tags')
 
@@ -255,7 +305,7 @@ class Comment(db.Model):
     flag = db.Column(db.Integer, default=0)
 
     replied_id = db.Column(db.Integer, db.ForeignKey('comment.id'))
-    author_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     photo_id = db.Column(db.Integer, db.ForeignKey('photo.id'))
 
     photo = db.relationship('Photo', back_populates='comments')
@@ -263,6 +313,9 @@ class Comment(db.Model):
     replies = db.relationship('Comment', back_populates='replied', cascade='all')
     replied = db.relationship('Comment', back_populates='replies', remote_side=[id])
 
+    # 照片详情页按照片筛选、按时间排序分页
+    __table_args__ = (db.Index('ix_comment_photo_id_timestamp', 'photo_id', 'timestamp'),)
+
 
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -273,29 +326,208 @@ class Notification(db.Model):
     receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     receiver = db.relationship('User', back_populates='notifications')
 
+    # 只索引未读通知，未读数量的重建和未读列表的查询只需要扫描很小的索引
+    __table_args__ = (
+        db.Index('ix_notification_receiver_id_unread', 'receiver_id',
+                 postgresql_where=db.text('is_read = false'), sqlite_where=db.text('is_read = 0')),
+    )
+
+
+# 首页动态的物化时间线：每个关注者一条记录，由albumy.feeds维护
+class Timeline(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    photo_id = db.Column(db.Integer, db.ForeignKey('photo.id'), primary_key=True)
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    timestamp = db.Column(db.DateTime) # 照片的上传时间
+
+    __table_args__ = (db.Index('ix_timeline_user_id_timestamp', 'user_id', 'timestamp', 'photo_id'),)
+
+
+
+# 等待删除的账户和文件。kind为user时target是用户id，账户的数据由后台任务分批删除；
+# kind为upload、avatar时target是上传目录、头像目录中的文件名
+class PendingDeletion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    target = db.Column(db.String(255), nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# 管理后台按用户名、邮箱前缀搜索用户。PostgreSQL在非C排序规则下，普通索引不能用于LIKE 'abc%'，
+# 需要另外建立varchar_pattern_ops索引；其他数据库使用范围条件，由username、email上已有的索引支持（见admin._prefix_match）
+for _column in ('username', 'email'):
+    db.event.listen(User.__table__, 'after_create', db.DDL(
+        'CREATE INDEX ix_user_%s_pattern ON "user" (%s varchar_pattern_ops)' % (_column, _column)
+    ).execute_if(dialect='postgresql'))
+
+
+# 每日统计：上传的照片、新注册的用户、收藏和评论的数量，由flask stats rollup命令汇总
+class DailyStat(db.Model):
+    date = db.Column(db.Date, primary_key=True)
+    uploads = db.Column(db.Integer, default=0)
+    new_users = db.Column(db.Integer, default=0)
+    collects = db.Column(db.Integer, default=0)
+    comments = db.Column(db.Integer, default=0)
+
+
+# 记录需要删除的文件，去掉空值和重复的文件名（缩略图生成失败时与原图同名）
+def queue_files(connection, kind, filenames):
+    rows = [{'kind': kind, 'target': filename, 'timestamp': datetime.utcnow()}
+            for filename in dict.fromkeys(filenames) if filename]
+    if rows:
+        connection.execute(PendingDeletion.__table__.insert(), rows)
+    return len(rows)
+
+
+# 计数缓存字段的维护：在插入、删除记录的同一个事务中，使用UPDATE ... SET count = count + 1对计数做增减，
+# 避免先读取再写入带来的并发覆盖问题
+def _change_count(connection, model, column_name, id, delta):
+    table = model.__table__
+    column = table.c[column_name]
+    connection.execute(table.update().where(table.c.id == id).values({column: column + delta}))
+
+
+@db.event.listens_for(Photo, 'after_insert')
+def increase_photo_count(mapper, connection, target):
+    _change_count(connection, User, 'photo_count', target.author_id, 1)
+
+
+@db.event.listens_for(Photo, 'after_delete')
+def decrease_photo_count(mapper, connection, target):
+    _change_count(connection, User, 'photo_count', target.author_id, -1)
+
+
+@db.event.listens_for(Collect, 'after_insert')
+def increase_collect_count(mapper, connection, target):
+    _change_count(connection, Photo, 'collect_count', target.collected_id, 1)
+    _change_count(connection, User, 'collection_count', target.collector_id, 1)
+
 
+@db.event.listens_for(Collect, 'after_delete')
+def decrease_collect_count(mapper, connection, target):
+    _change_count(connection, Photo, 'collect_count', target.collected_id, -1)
+    _change_count(connection, User, 'collection_count', target.collector_id, -1)
 
-# 图片删除事件监听：删除photo时，自动删除文件系统中的图片文件
+
+@db.event.listens_for(Comment, 'after_insert')
+def increase_comment_count(mapper, connection, target):
+    _change_count(connection, Photo, 'comment_count', target.photo_id, 1)
+
+
+@db.event.listens_for(Comment, 'after_delete')
+def decrease_comment_count(mapper, connection, target):
+    _change_count(connection, Photo, 'comment_count', target.photo_id, -1)
+
+
+@db.event.listens_for(Follow, 'after_insert')
+def increase_follow_count(mapper, connection, target):
+    _change_count(connection, User, 'following_count', target.follower_id, 1)
+    _change_count(connection, User, 'follower_count', target.followed_id, 1)
+
+
+@db.event.listens_for(Follow, 'after_delete')
+def decrease_follow_count(mapper, connection, target):
+    _change_count(connection, User, 'following_count', target.follower_id, -1)
+    _change_count(connection, User, 'follower_count', target.followed_id, -1)
+
+
+# 未读通知数量：新增未读通知、删除未读通知、通知标记为已读（或未读）时更新
+@db.event.listens_for(Notification, 'after_insert')
+def increase_unread_notification_count(mapper, connection, target):
+    if not target.is_read:
+        _change_count(connection, User, 'unread_notification_count', target.receiver_id, 1)
+        mark_user_stale(target, target.receiver_id)
+
+
+@db.event.listens_for(Notification, 'after_delete')
+def decrease_unread_notification_count(mapper, connection, target):
+    if not target.is_read:
+        _change_count(connection, User, 'unread_notification_count', target.receiver_id, -1)
+        mark_user_stale(target, target.receiver_id)
+
+
+@db.event.listens_for(Notification, 'after_update')
+def update_unread_notification_count(mapper, connection, target):
+    history = db.inspect(target).attrs.is_read.history
+    if not history.added:
+        return
+    was_read = bool(history.deleted[0]) if history.deleted else False
+    if bool(target.is_read) != was_read:
+        _change_count(connection, User, 'unread_notification_count', target.receiver_id, -1 if target.is_read else 1)
+        mark_user_stale(target, target.receiver_id)
+
+
+# 用户记录修改或删除后，提交时删除缓存的登录用户快照
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def expire_user_snapshot(mapper, connection, target):
+    mark_user_stale(target, target.id)
+
+
+# 首页时间线的维护（只在ALBUMY_FEED_MODE为push时生效），在计数更新之后执行
+@db.event.listens_for(Photo, 'after_insert')
+def fan_out_photo(mapper, connection, target):
+    feeds.fan_out(connection, target)
+
+
+@db.event.listens_for(Photo, 'after_delete')
+def remove_photo_from_timelines(mapper, connection, target):
+    feeds.remove_photo(connection, target.id)
+
+
+@db.event.listens_for(Follow, 'after_insert')
+def backfill_timeline(mapper, connection, target):
+    feeds.backfill(connection, target.follower_id, target.followed_id)
+
+
+@db.event.listens_for(Follow, 'after_delete')
+def prune_timeline(mapper, connection, target):
+    feeds.prune(connection, target.follower_id, target.followed_id, object_session(target))
+
+
+'''
+tagging是关联表，增删关联记录时不会触发映射类事件，所以在flush之前根据Photo.tags的变更历史计算每个标签的增减量。
+删除照片时，关联记录会在照片的before_delete事件之前被删除，所以被删除照片的标签也需要在这里提前统计。
+'''
+@db.event.listens_for(db.session, 'before_flush')
+def update_tag_photo_count(session, flush_context, instances):
+    deltas = {}
+    for obj in session.new.union(session.dirty):
+        if isinstance(obj, Photo):
+            history = db.inspect(obj).attrs.tags.history
+            for tag in history.added or ():
+                deltas[tag] = deltas.get(tag, 0) + 1
+            for tag in history.deleted or ():
+                deltas[tag] = deltas.get(tag, 0) - 1
+    for obj in session.deleted:
+        if isinstance(obj, Photo):
+            for tag in obj.tags:
+                deltas[tag] = deltas.get(tag, 0) - 1
+
+    record_tag_changes(sum(abs(delta) for delta in deltas.values()), session)
+    for tag, delta in deltas.items():
+        if delta == 0 or tag in session.deleted:
+            continue
+        if db.inspect(tag).persistent:
+            tag.photo_count = Tag.photo_count + delta
+        else:
+            tag.photo_count = (tag.photo_count or 0) + delta
+
+
+# 图片删除事件监听：删除photo时，删除文件系统中的图片文件
 '''
 记录删除对应的SQLAlchemy事件为after_delete，这个事件接收的参数为mapper、connection和target，
-我们通过将event.listen_for()装饰器中的named参数设为True来使用**kwargs传递参数。在函数中，我们通过表示
-目标对象的target获取被删除对象的文件名字段，通过ALBUMY_UPLOAD_PATH变量构造文件路径，然后使用os.remove()
-函数删除对应的文件。
+我们通过将event.listen_for()装饰器中的named参数设为True来使用**kwargs传递参数。
+文件不在事务中直接删除（事务回滚后文件已经不存在），而是在同一个事务中写入PendingDeletion表，
+由deletion模块中的清理任务在提交之后删除，见albumy/deletion.py。
 '''
 @db.event.listens_for(Photo, 'after_delete', named=True)
 def delete_photo(**kwargs):
     target = kwargs['target']
-    for filename in [target.filename, target.filename_s, target.filename_m]:
-        path = os.path.join(current_app.config['ALBUMY_UPLOAD_PATH', filename])
-        if os.path.exists(path):
-            os.remove(path)
+    queue_files(kwargs['connection'], 'upload', [target.filename, target.filename_s, target.filename_m])
 
 
 @db.event.listens_for(User, 'after_delete', named=True)
 def delete_avatars(**kwargs):
     target = kwargs['target']
-    for filename in [target.avatar_s, target.avatar_m, target.avatar_l, target.avatar_raw]:
-        if filename is not None:
-            path = os.path.join(current_app.config['AVATARS_SAVE_PATH'], filename)
-            if os.path.exists(path):
-                os.remove(path)
\ No newline at end of file
+    queue_files(kwargs['connection'], 'avatar', [target.avatar_s, target.avatar_m, target.avatar_l, target.avatar_raw])
@@ -1,34 +1,270 @@
-from flask import url_for
+import atexit
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import url_for, current_app
 
 from albumy.extensions import db
-from albumy.models import Notification
+from albumy.models import Notification, User
+from albumy.usercache import invalidate_user
+
+
+MESSAGES = {
+    'follow': (
+        'User <a href="%(actor_url)s">%(actor)s</a> followed you.',
+        'User <a href="%(actor_url)s">%(actor)s</a> and %(others)d other users followed you.'
+    ),
+    'comment': (
+        '<a href="%(url)s#comments">This photo</a> has new comment/reply.',
+        '<a href="%(url)s#comments">This photo</a> has %(count)d new comments/replies.'
+    ),
+    'collect': (
+        'User <a href="%(actor_url)s">%(actor)s</a> collected your <a href="%(url)s">photo</a>',
+        'User <a href="%(actor_url)s">%(actor)s</a> and %(others)d other users collected your <a href="%(url)s">photo</a>'
+    )
+}
+
+
+class _Entry:
+
+    def __init__(self, kind, receiver_id, url):
+        self.kind = kind
+        self.receiver_id = receiver_id
+        self.url = url
+        self.count = 0
+        self.actors = OrderedDict() # 用户名 -> 主页地址
+        self.timestamp = None
+
+    # 写入失败后放回缓冲区时，与期间新到达的同一通知合并，较早的用户排在前面
+    def merge(self, later):
+        self.url = later.url
+        self.count += later.count
+        self.timestamp = later.timestamp
+        for actor, actor_url in later.actors.items():
+            self.actors.pop(actor, None)
+            self.actors[actor] = actor_url
+
+    def add(self, url, actor=None, actor_url=None):
+        self.url = url
+        self.count += 1
+        self.timestamp = datetime.utcnow()
+        if actor is not None:
+            self.actors.pop(actor, None)
+            self.actors[actor] = actor_url
+
+    # 最近的一个用户显示在消息中，其余的合并成数量
+    def message(self):
+        single, collapsed = MESSAGES[self.kind]
+        actor, actor_url = next(reversed(self.actors.items())) if self.actors else (None, None)
+        others = len(self.actors) - 1
+        template = collapsed if others > 0 or (not self.actors and self.count > 1) else single
+        return template % dict(url=self.url, actor=actor, actor_url=actor_url, others=others, count=self.count)
+
+
+'''
+通知合并与批量写入。push_*_notification()不再每次插入一条记录并提交，而是把事件放入进程内的缓冲区，
+同一接收者、同一类型、同一对象（照片或被关注的用户）的事件合并为一条通知，例如“User a and 11 other users collected your photo”。
+缓冲区在第一个事件到达ALBUMY_NOTIFICATION_FLUSH_INTERVAL秒后、或者合并后的通知达到ALBUMY_NOTIFICATION_BATCH_SIZE条时写入数据库：
+一条多行INSERT写入全部通知，一条executemany的UPDATE增加各接收者的未读数量，在单独的连接和事务中提交，
+不会提交调用者（例如视图）会话中的修改；写入失败时通知放回缓冲区，在下一次写入时重试。
+ALBUMY_NOTIFICATION_FLUSH_INTERVAL为0时每次调用都立即写入（测试环境使用）。进程正常退出时写入剩余的通知；
+工作进程被强制结束（超时、SIGKILL）时不会执行atexit，缓冲区中最多一个间隔内的通知会丢失。
+'''
+class NotificationAggregator:
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._buffer = OrderedDict()
+        self._timer = None
+        self._app = None # 最近一次写入缓冲区的应用，进程退出时用它写入剩余的通知
+        self._atexit_registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ALBUMY_NOTIFICATION_FLUSH_INTERVAL', 2)
+        app.config.setdefault('ALBUMY_NOTIFICATION_BATCH_SIZE', 500)
+        app.extensions['notification_aggregator'] = self
+        # 每个进程只注册一次，测试中会多次调用init_app()
+        with self._lock:
+            if not self._atexit_registered:
+                atexit.register(self._flush_at_exit)
+                self._atexit_registered = True
+
+    def push(self, kind, receiver_id, target_id, url, actor=None, actor_url=None):
+        app = current_app._get_current_object()
+        interval = app.config['ALBUMY_NOTIFICATION_FLUSH_INTERVAL']
+        with self._lock:
+            self._app = app
+            key = (kind, receiver_id, target_id)
+            entry = self._buffer.get(key)
+            if entry is None:
+                entry = self._buffer[key] = _Entry(kind, receiver_id, url)
+            entry.add(url, actor, actor_url)
+            full = len(self._buffer) >= app.config['ALBUMY_NOTIFICATION_BATCH_SIZE']
+            if interval and not full and self._timer is None:
+                self._timer = threading.Timer(interval, self._flush_in_context, args=(app,))
+                self._timer.daemon = True
+                self._timer.start()
+        if not interval or full:
+            try:
+                self.flush()
+            except Exception:
+                # 通知已放回缓冲区，不影响当前请求
+                app.logger.exception('Failed to write notifications.')
+
+    def _flush_at_exit(self):
+        if self._app is not None:
+            self._flush_in_context(self._app)
+
+    def _flush_in_context(self, app):
+        with app.app_context():
+            try:
+                self.flush()
+            except Exception:
+                app.logger.exception('Failed to write notifications.')
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+    # 把写入失败的通知放回缓冲区
+    def _restore(self, items):
+        with self._lock:
+            buffer = OrderedDict(items)
+            for key, entry in self._buffer.items():
+                if key in buffer:
+                    buffer[key].merge(entry)
+                else:
+                    buffer[key] = entry
+            self._buffer = buffer
+
+    # 把缓冲区中的通知写入数据库，返回写入的条数
+    def flush(self):
+        with self._lock:
+            items = list(self._buffer.items())
+            entries = [entry for key, entry in items]
+            self._buffer.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not entries:
+            return 0
+
+        rows = [
+            dict(message=entry.message(), is_read=False, timestamp=entry.timestamp, receiver_id=entry.receiver_id)
+            for entry in entries
+        ]
+        counts = {}
+        for entry in entries:
+            counts[entry.receiver_id] = counts.get(entry.receiver_id, 0) + 1
+        # 多行INSERT不会触发模型事件，未读数量在这里更新
+        table = User.__table__
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(Notification.__table__.insert().values(rows))
+                connection.execute(
+                    table.update().where(table.c.id == db.bindparam('receiver_id')).values(
+                        unread_notification_count=table.c.unread_notification_count + db.bindparam('count')
+                    ),
+                    [{'receiver_id': receiver_id, 'count': count} for receiver_id, count in counts.items()]
+                )
+        except Exception:
+            self._restore(items)
+            raise
+        invalidate_user(*counts)
+        return len(rows)
+
+
+notification_aggregator = NotificationAggregator()
 
 
 # 被关注通知
 def push_follow_notification(follower, receiver):
-    message = 'User <a href="%s">%s</a> followed you.' % (url_for('user.index', username=follower.username), follower.username)
-    notification = Notification(message=message, receiver=receiver)
-    db.session.add(notification)
-    db.session.commit()
+    notification_aggregator.push(
+        'follow', receiver.id, receiver.id, None,
+        actor=follower.username, actor_url=url_for('user.index', username=follower.username)
+    )
 
 
 # 收到评论或回复通知
 def push_comment_notification(photo_id, receiver, page=1):
-    message = '<a href="%s#comments">This photo</a> has new comment/reply.' % (url_for('mian.show_photo', photo_id=photo_id, page=page))
-    notification = Notification(message=message, receiver=receiver)
-    db.session.add(notification)
-    db.session.commit()
+    notification_aggregator.push('comment', receiver.id, photo_id, url_for('main.show_photo', photo_id=photo_id, page=page))
 
 
 # 照片被收藏通知
 def push_collect_notification(collector, photo_id, receiver):
-    message = 'User <a href="%s">%s</a> collected your <a href="%s">photo</a>' % (\
-                url_for('user.index', username=collector.username),
-                collector.username,
-                url_for('main.show_photo', photo_id=photo_id)
-        )
-    notification = Notification(message=message, receiver=receiver)
-    db.session.add(notification)
+    notification_aggregator.push(
+        'collect', receiver.id, photo_id, url_for('main.show_photo', photo_id=photo_id),
+        actor=collector.username, actor_url=url_for('user.index', username=collector.username)
+    )
+
+
+'''
+把用户的未读通知标记为已读：一条UPDATE ... WHERE receiver_id = ? AND is_read = false，不把通知加载到会话中。
+max_id、until限定只标记id不超过max_id、时间不晚于until的通知，客户端用它确认已经展示过的通知，之后到达的新通知保持未读。
+批量UPDATE不会触发模型事件，未读数量在同一个事务中按实际标记的条数扣减。返回标记的数量。
+'''
+def mark_notifications_read(receiver, max_id=None, until=None):
+    query = Notification.query.filter(Notification.receiver_id == receiver.id, Notification.is_read == False)
+    if max_id is not None:
+        query = query.filter(Notification.id <= max_id)
+    if until is not None:
+        query = query.filter(Notification.timestamp <= until)
+    count = query.update({'is_read': True}, synchronize_session=False)
+    if count:
+        User.query.filter_by(id=receiver.id).update({
+            'unread_notification_count': User.unread_notification_count - count
+        }, synchronize_session=False)
     db.session.commit()
-                
-                
\ No newline at end of file
+    if count:
+        invalidate_user(receiver.id)
+    return count
+
+
+# 分批删除满足条件的通知，每批只删除batch_size条并立即提交，避免长时间锁表；dry_run时只统计数量
+def _delete_in_batches(criteria, batch_size, dry_run):
+    if dry_run:
+        return Notification.query.filter(*criteria).count()
+    total = 0
+    while True:
+        ids = [row[0] for row in db.session.query(Notification.id).filter(*criteria).limit(batch_size)]
+        if not ids:
+            return total
+        total += Notification.query.filter(Notification.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+
+'''
+清理通知表，只删除已读通知，未读通知和未读数量不受影响：
+    1. 删除days天之前的已读通知；
+    2. 每个用户最多保留最新的keep条通知，超出部分中的已读通知被删除。
+'''
+def compact_notifications(days, keep=None, batch_size=1000, dry_run=False):
+    result = {}
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    result['expired'] = _delete_in_batches(
+        [Notification.is_read == True, Notification.timestamp < cutoff], batch_size, dry_run
+    )
+
+    result['over_cap'] = 0
+    if keep:
+        receivers = db.session.query(Notification.receiver_id) \
+                        .group_by(Notification.receiver_id) \
+                        .having(db.func.count(Notification.id) > keep).all()
+        for receiver_id, in receivers:
+            # 不计第1步删除的通知，第keep+1新的通知及更早的通知超出保留数量
+            remaining = db.or_(Notification.is_read == False, Notification.timestamp >= cutoff)
+            boundary = db.session.query(Notification.id) \
+                        .filter(Notification.receiver_id == receiver_id, remaining) \
+                        .order_by(Notification.id.desc()).offset(keep).limit(1).scalar()
+            if boundary is None:
+                continue
+            result['over_cap'] += _delete_in_batches([
+                Notification.receiver_id == receiver_id,
+                Notification.is_read == True,
+                Notification.timestamp >= cutoff,
+                Notification.id <= boundary
+            ], batch_size, dry_run)
+    return result
+
@@ -0,0 +1,124 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import request, url_for
+from sqlalchemy import and_, or_
+
+
+'''
+游标分页（keyset分页）：按排序字段的值定位下一页，不使用OFFSET，也不统计总数，翻到多深的位置查询代价都一样。
+columns是排序字段，最后一个字段必须唯一（通常是主键），例如(Photo.timestamp, Photo.id)，默认按降序排列。
+排序字段不属于查询结果中的对象时（例如按连接表的字段排序），通过key从对象中取出对应的值。
+URL中用after=<游标>获取下一页，before=<游标>获取上一页，游标是当前页最后/第一条记录排序字段值的编码。
+'''
+class CursorPagination:
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    # 保留当前URL中的其他参数，替换游标参数
+    def _url(self, **cursor):
+        args = request.args.to_dict()
+        for key in ('after', 'before', 'page'):
+            args.pop(key, None)
+        args.update(request.view_args or {})
+        args.update(cursor)
+        return url_for(request.endpoint, **args)
+
+    @property
+    def next_url(self):
+        return self._url(after=self.next_cursor)
+
+    @property
+    def prev_url(self):
+        return self._url(before=self.prev_cursor)
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+# 按排序字段的类型还原游标中的值，类型不符（例如被篡改的游标）时抛出TypeError
+def _decode_value(column, value):
+    python_type = column.type.python_type
+    if python_type is datetime:
+        if not isinstance(value, str):
+            raise TypeError(value)
+        return datetime.fromisoformat(value)
+    # bool是int的子类，整数字段不接受true/false
+    if not isinstance(value, python_type) or (isinstance(value, bool) and python_type is not bool):
+        raise TypeError(value)
+    return value
+
+
+# 游标无法解析时返回None，视图回到第一页
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        return [_decode_value(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+
+# 排序字段组成的元组在游标之后（descending时是小于）的条件
+def _after(columns, values, descending):
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        compare = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal, compare))
+    return or_(*clauses)
+
+
+def cursor_paginate(query, columns, per_page, descending=True, key=None):
+    after = request.args.get('after')
+    before = request.args.get('before')
+    values = None
+    if after:
+        values = decode_cursor(after, columns)
+    elif before:
+        values = decode_cursor(before, columns)
+    backwards = values is not None and not after
+
+    # 向前翻页时反转排序方向，取到数据后再倒序
+    reverse = descending != backwards
+    order = [column.desc() if reverse else column.asc() for column in columns]
+    if values is not None:
+        query = query.filter(_after(columns, values, reverse))
+    items = query.order_by(None).order_by(*order).limit(per_page + 1).all()
+    more = len(items) > per_page
+    items = items[:per_page]
+    if backwards:
+        items.reverse()
+
+    def cursor(item):
+        if key is not None:
+            return encode_cursor(key(item))
+        return encode_cursor([getattr(item, column.key) for column in columns])
+
+    # 多取的一条记录说明当前翻页方向上还有数据；反方向上，只要是通过游标翻过来的就一定有数据
+    if backwards:
+        has_next, has_prev = True, more
+    else:
+        has_next, has_prev = more, values is not None
+    next_cursor = prev_cursor = None
+    if items and has_next:
+        next_cursor = cursor(items[-1])
+    if items and has_prev:
+        prev_cursor = cursor(items[0])
+    return CursorPagination(items, per_page, next_cursor, prev_cursor)
@@ -0,0 +1,85 @@
+import threading
+import time
+import uuid
+
+from flask import current_app, g, has_request_context
+from sqlalchemy.orm import selectinload
+
+from albumy.extensions import cache
+
+
+PERMISSION_VERSION_KEY = 'albumy:permission-version'
+
+'''
+角色与权限只会通过Role.init_role()修改，所以每个进程只需加载一次角色→权限名称集合的映射，之后User.can()只是一次集合成员判断。
+映射通过缓存中的版本号失效：修改角色权限后调用invalidate_permissions()写入新版本号，各个进程在下一个请求中发现版本号变化后重新加载。
+版本号只有在共享的缓存后端中才能被其他进程看到，flask init、flask forge等命令在单独的进程中修改角色，
+所以映射最多保留ALBUMY_PERMISSION_LOCAL_TIMEOUT秒，之后无论版本号是否变化都重新加载。
+'''
+_lock = threading.Lock()
+_roles = {}
+_version = None
+_expires = 0
+
+
+def _load_roles():
+    from albumy.models import Role
+
+    roles = {}
+    for role in Role.query.options(selectinload(Role.permissions)):
+        roles[role.id] = (role.name, frozenset(permission.name for permission in role.permissions))
+    return roles
+
+
+# 读取当前版本号，同一个请求内只读取一次
+def _current_version():
+    if has_request_context() and '_permission_version' in g:
+        return g._permission_version
+    version = cache.get(PERMISSION_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(PERMISSION_VERSION_KEY, version, timeout=0)
+    if has_request_context():
+        g._permission_version = version
+    return version
+
+
+def _get_role(role_id, reload=False):
+    global _roles, _version, _expires
+    version = _current_version()
+    if reload or version != _version or _expires <= time.time():
+        with _lock:
+            _roles = _load_roles()
+            _version = version
+            _expires = time.time() + current_app.config['ALBUMY_PERMISSION_LOCAL_TIMEOUT']
+    return _roles.get(role_id)
+
+
+# 返回角色的(角色名称, 权限名称集合)，遇到未加载过的角色时重新加载一次
+def get_role(role_id):
+    if role_id is None:
+        return None
+    role = _get_role(role_id)
+    if role is None:
+        role = _get_role(role_id, reload=True)
+    return role
+
+
+def role_name(role_id):
+    role = get_role(role_id)
+    return role[0] if role is not None else None
+
+
+def role_permissions(role_id):
+    role = get_role(role_id)
+    return role[1] if role is not None else frozenset()
+
+
+# 角色或权限修改后调用，使所有进程中的映射失效
+def invalidate_permissions():
+    global _version
+    cache.set(PERMISSION_VERSION_KEY, uuid.uuid4().hex, timeout=0)
+    if has_request_context():
+        g.pop('_permission_version', None)
+    with _lock:
+        _version = None
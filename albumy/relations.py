@@ -0,0 +1,70 @@
+from flask import g, has_request_context
+from flask_login import current_user
+
+from albumy.extensions import db
+
+
+# 请求范围内当前用户与一组照片、一组用户之间的收藏和关注状态。
+# 视图函数在渲染列表前调用preload_relations()，每种状态只需一次查询，User.is_collecting()等方法会优先从这里读取结果。
+class RelationState:
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.photo_ids = set()
+        self.collected_ids = set()
+        self.user_ids = set()
+        self.following_ids = set()
+        self.follower_ids = set()
+
+    def load_photos(self, photos):
+        from albumy.models import Collect
+
+        ids = {photo.id for photo in photos} - self.photo_ids
+        if not ids:
+            return
+        rows = db.session.query(Collect.collected_id) \
+                    .filter(Collect.collector_id == self.user_id, Collect.collected_id.in_(ids))
+        self.collected_ids.update(row[0] for row in rows)
+        self.photo_ids.update(ids)
+
+    def load_users(self, users):
+        from albumy.models import Follow
+
+        ids = {user.id for user in users} - self.user_ids
+        if not ids:
+            return
+        following = db.session.query(Follow.followed_id) \
+                        .filter(Follow.follower_id == self.user_id, Follow.followed_id.in_(ids))
+        followers = db.session.query(Follow.follower_id) \
+                        .filter(Follow.followed_id == self.user_id, Follow.follower_id.in_(ids))
+        self.following_ids.update(row[0] for row in following)
+        self.follower_ids.update(row[0] for row in followers)
+        self.user_ids.update(ids)
+
+
+# 获取某个用户在当前请求中已加载的状态，只有当前登录用户才会有
+def get_relation_state(user):
+    if not has_request_context():
+        return None
+    state = g.get('_relation_state')
+    if state is None or state.user_id != user.id:
+        return None
+    return state
+
+
+# 批量加载当前用户对一组照片的收藏状态、对一组用户的关注状态
+def preload_relations(photos=(), users=()):
+    if not current_user.is_authenticated:
+        return None
+    state = g.get('_relation_state')
+    if state is None or state.user_id != current_user.id:
+        state = g._relation_state = RelationState(current_user.id)
+    state.load_photos(photos)
+    state.load_users(users)
+    return state
+
+
+# 收藏、关注状态发生变化后丢弃已加载的状态
+def clear_relations():
+    if has_request_context():
+        g.pop('_relation_state', None)
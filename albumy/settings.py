@@ -17,6 +17,11 @@ class BaseConfig:
 
     MAX_CONTENT_LENGTH = 3 * 1024 * 1024
 
+    # 缓存，多个工作进程之间共享缓存时可以使用FileSystemCache
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'SimpleCache')
+    CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(basedir, 'cache'))
+    CACHE_DEFAULT_TIMEOUT = 300
+
     # 邮件发送
     ALBUMY_ADMIN_EMAIL = os.environ.get('ALBUMY_ADMIN', 'yaqi.zheng@guokr.com')
     ALBUMY_MAIL_SUBJECT_PREFIX = '[Albumy]'
@@ -43,6 +48,26 @@ class BaseConfig:
         ALBUMY_PHOTO_SIZE['medium']: '_m'
     }
 
+    # 照片详情页是否预先加载上一张、下一张照片的中等尺寸图片
+    ALBUMY_PREFETCH_NEIGHBOR_IMAGES = False
+
+    # 缩略图生成方式：inline在请求中生成，pool交给进程池在后台生成，worker交给flask thumbnails命令启动的工作进程生成
+    ALBUMY_THUMBNAIL_MODE = os.environ.get('ALBUMY_THUMBNAIL_MODE', 'pool')
+    ALBUMY_THUMBNAIL_WORKERS = 2
+    ALBUMY_THUMBNAIL_QUEUE_SIZE = 60 # 等待处理的照片数量上限，超过后拒绝上传
+    ALBUMY_THUMBNAIL_RETRY_AFTER = 10 * 60 # pool模式下进程启动时重新提交上传超过这段时间仍在处理中的照片
+
+    # 按需生成的图片尺寸，通过/uploads/<preset>/<filename>访问，生成的文件超过容量上限后按最近访问时间淘汰
+    ALBUMY_PHOTO_PRESETS = {'grid': 200, 'small': 400, 'medium': 800, 'large': 1600}
+    ALBUMY_DERIVATIVE_PATH = os.path.join(ALBUMY_UPLOAD_PATH, 'derivatives')
+    ALBUMY_DERIVATIVE_CACHE_SIZE = 1024 * 1024 * 1024 # 1GB
+
+    # 图片和头像的文件名不会复用，允许浏览器缓存一年；文件内容可以交给前端服务器发送：
+    # Apache/lighttpd设置USE_X_SENDFILE=True，Nginx设置ALBUMY_ACCEL_REDIRECT_PATH为指向上传目录的internal location
+    ALBUMY_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
+    ALBUMY_ACCEL_REDIRECT_PATH = os.environ.get('ALBUMY_ACCEL_REDIRECT_PATH')
+
     # 头像设置
     AVATARS_SAVE_PATH = os.path.join(ALBUMY_UPLOAD_PATH, 'avatars')
     AVATARS_SIZE_TUPLE = (30, 100, 200)
@@ -53,7 +78,55 @@ class BaseConfig:
     ALBUMY_COMMENT_PER_PAGE = 12
     ALBUMY_USER_PER_PAGE = 12
     ALBUMY_NOTIFICATION_PER_PAGE = 12
+    ALBUMY_EXPLORE_PER_PAGE = 12
+
+    # 通知合并：缓冲区在第一个事件到达多少秒后写入数据库，以及合并后的通知达到多少条时立即写入；间隔为0时不缓冲。
+    # 缓冲区在进程内存中，工作进程被强制结束（超时、SIGKILL）时最多丢失一个间隔内的通知，不能丢失时设为0
+    ALBUMY_NOTIFICATION_FLUSH_INTERVAL = 2
+    ALBUMY_NOTIFICATION_BATCH_SIZE = 500
+
+    # 通知保留：flask notifications compact删除多少天之前的已读通知，每个用户最多保留多少条通知
+    ALBUMY_NOTIFICATION_RETENTION_DAYS = 90
+    ALBUMY_NOTIFICATION_KEEP = 1000
+
+    # 探索页随机照片：照片id范围（以及id池）的缓存时间，id池大小为0时每次请求直接按id随机抽取
+    ALBUMY_EXPLORE_CACHE_TIMEOUT = 60
+    ALBUMY_EXPLORE_POOL_SIZE = 0
+
+    # 首页动态：pull在读取时连接关注表查询，push在上传时写入关注者的时间线；关注者超过上限的用户在读取时拉取
+    ALBUMY_FEED_MODE = os.environ.get('ALBUMY_FEED_MODE', 'pull')
+    ALBUMY_FEED_FANOUT_LIMIT = 5000
+    ALBUMY_FEED_BACKFILL = 100 # 关注某人时补进时间线的照片数量
+    ALBUMY_FEED_REFILL_ASYNC = True # 关注者降回上限时，是否在后台线程中给所有关注者补齐照片
+
+    # 热门标签：共享缓存的超时时间、进程内缓存的超时时间，标签变化累计多少次后重新计算；半衰期（天）为None时按照片总数排序
+    ALBUMY_TRENDING_TAGS = 10
+    ALBUMY_TRENDING_TIMEOUT = 10 * 60
+    ALBUMY_TRENDING_LOCAL_TIMEOUT = 30
+    ALBUMY_TRENDING_RECOMPUTE_AFTER = 50
+    ALBUMY_TRENDING_HALF_LIFE = None
+
+    # 登录用户快照：共享缓存的超时时间、进程内缓存的超时时间和数量上限，为0时每个请求都查询数据库。
+    # 只在CACHE_TYPE是多个进程共享的缓存（FileSystemCache、RedisCache等）时生效；锁定、封禁用户后，
+    # 其他工作进程最多在进程内缓存的超时时间内继续使用旧的状态
+    ALBUMY_USER_CACHE_TIMEOUT = 5 * 60
+    ALBUMY_USER_CACHE_LOCAL_TIMEOUT = 5
+    ALBUMY_USER_CACHE_LOCAL_SIZE = 10000
+
+    # 每个进程中角色→权限映射的最长保留时间，角色在其他进程中修改后最多经过这段时间生效
+    ALBUMY_PERMISSION_LOCAL_TIMEOUT = 30
+
+    # 照片详情页每一页评论的缓存时间，为0时不缓存；只在CACHE_TYPE是多个进程共享的缓存时生效
+    ALBUMY_COMMENT_CACHE_TIMEOUT = 5 * 60
+
+    # 照片与账户删除：每批删除的记录数量；为True时在后台线程中删除账户数据和文件
+    ALBUMY_DELETION_BATCH_SIZE = 500
+    ALBUMY_DELETION_ASYNC = True
     
+    # 管理后台首页：统计数字的缓存时间，显示最近多少天的每日统计
+    ALBUMY_ADMIN_STATS_TIMEOUT = 60
+    ALBUMY_ADMIN_STATS_DAYS = 14
+
     # 管理后台列表展示
     ALBUMY_MANAGE_USER_PER_PAGE = 20
     ALBUMY_MANAGE_PHOTO_PER_PAGE = 20
@@ -68,7 +141,11 @@ class DevelopmentConfig(BaseConfig):
 class TestingConfig(BaseConfig):
     TESTING = True
     WTF_CSRF_ENABLED = False
-    SQLALCHEMY_DATABASE_URI = os.environ.get('SQLALCHEMY_DATABASE_URI')
+    ALBUMY_THUMBNAIL_MODE = 'inline'
+    ALBUMY_NOTIFICATION_FLUSH_INTERVAL = 0
+    ALBUMY_DELETION_ASYNC = False
+    ALBUMY_FEED_REFILL_ASYNC = False
+    SQLALCHEMY_DATABASE_URI = 'sqlite://' # 内存数据库，测试结束后不保留数据
 
 
 class ProductionConfig(BaseConfig):
@@ -0,0 +1,107 @@
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func, select, true
+
+from albumy.extensions import db, cache
+from albumy.models import Collect, Comment, DailyStat, Photo, Tag, User
+
+
+STATS_KEY = 'albumy:admin-stats'
+
+'''
+管理后台首页的统计数字。原来每次访问执行8条COUNT(*)查询，现在每张表一个带CASE条件计数的聚合子查询，
+四个子查询各返回一行，交叉连接后在一条语句中得到全部数字（MySQL不支持FILTER子句，所以使用CASE）。
+结果连同最近ALBUMY_ADMIN_STATS_DAYS天的每日统计缓存ALBUMY_ADMIN_STATS_TIMEOUT秒。
+每日统计保存在DailyStat表中，由flask stats rollup命令增量更新：只重新统计上次汇总的最后一天及之后的记录，不扫描历史数据。
+'''
+def compute_stats():
+    users = select(
+        func.count().label('user_count'),
+        func.count(case((User.locked == True, 1))).label('locked_users_count'),
+        func.count(case((User.active == False, 1))).label('blocked_users_count')
+    ).select_from(User).subquery()
+    photos = select(
+        func.count().label('photo_count'),
+        func.count(case((Photo.flag > 0, 1))).label('reproted_photos_count')
+    ).select_from(Photo).subquery()
+    tags = select(func.count().label('tag_count')).select_from(Tag).subquery()
+    comments = select(
+        func.count().label('comment_count'),
+        func.count(case((Comment.flag > 0, 1))).label('reported_comments_count')
+    ).select_from(Comment).subquery()
+    statement = select(users, photos, tags, comments) \
+                    .select_from(users.join(photos, true()).join(tags, true()).join(comments, true()))
+    return dict(db.session.execute(statement).one()._mapping)
+
+
+def daily_stats(days):
+    since = date.today() - timedelta(days=days - 1)
+    return DailyStat.query.filter(DailyStat.date >= since).order_by(DailyStat.date.desc()).all()
+
+
+def admin_stats():
+    stats = cache.get(STATS_KEY)
+    if stats is None:
+        stats = compute_stats()
+        stats['daily_stats'] = [
+            (stat.date, stat.uploads, stat.new_users, stat.collects, stat.comments)
+            for stat in daily_stats(current_app.config['ALBUMY_ADMIN_STATS_DAYS'])
+        ]
+        cache.set(STATS_KEY, stats, timeout=current_app.config['ALBUMY_ADMIN_STATS_TIMEOUT'])
+    return stats
+
+
+# 管理后台用户列表中每个用户的评论数量和被举报的照片、评论数量：每张表一条按作者分组的查询，返回{用户id: {名称: 数量}}
+def user_activity(user_ids):
+    user_ids = set(user_ids)
+    activity = {user_id: {'comments': 0, 'reported_photos': 0, 'reported_comments': 0} for user_id in user_ids}
+    if not user_ids:
+        return activity
+    comments = db.session.query(Comment.author_id, func.count(), func.count(case((Comment.flag > 0, 1)))) \
+                    .filter(Comment.author_id.in_(user_ids)).group_by(Comment.author_id)
+    for user_id, count, reported in comments:
+        activity[user_id].update(comments=count, reported_comments=reported)
+    photos = db.session.query(Photo.author_id, func.count()) \
+                    .filter(Photo.author_id.in_(user_ids), Photo.flag > 0).group_by(Photo.author_id)
+    for user_id, reported in photos:
+        activity[user_id]['reported_photos'] = reported
+    return activity
+
+
+# SQLite的date()返回字符串，其他数据库返回date
+def _to_date(value):
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], '%Y-%m-%d').date()
+    return value
+
+
+def _count_by_day(column, start):
+    day = func.date(column)
+    query = db.session.query(day, func.count()).group_by(day)
+    if start is not None:
+        query = query.filter(column >= datetime.combine(start, datetime.min.time()))
+    return {_to_date(value): count for value, count in query}
+
+
+'''
+增量汇总每日统计：从since（默认为DailyStat中最后一天，它汇总时可能还没有结束）开始按天分组计数，
+替换这些天的记录，不提交。第一次执行时没有汇总记录，会统计全部历史数据。返回写入的天数。
+'''
+def rollup_daily_stats(since=None):
+    if since is None:
+        since = db.session.query(func.max(DailyStat.date)).scalar()
+    metrics = {
+        'uploads': _count_by_day(Photo.timestamp, since),
+        'new_users': _count_by_day(User.member_since, since),
+        'collects': _count_by_day(Collect.timestamp, since),
+        'comments': _count_by_day(Comment.timestamp, since)
+    }
+    days = set().union(*metrics.values())
+    if since is not None:
+        DailyStat.query.filter(DailyStat.date >= since).delete(synchronize_session=False)
+    rows = [dict({name: counts.get(day, 0) for name, counts in metrics.items()}, date=day) for day in sorted(days)]
+    if rows:
+        db.session.execute(DailyStat.__table__.insert(), rows)
+    cache.delete(STATS_KEY)
+    return len(rows)
@@ -0,0 +1,93 @@
+from sqlalchemy import select
+
+from albumy.counters import recount_tags
+from albumy.extensions import db
+from albumy.models import Tag, tagging
+from albumy.trending import record_tag_changes
+
+
+# 插入多行记录，违反唯一约束的行直接跳过（其他请求可能同时插入了相同的记录），返回实际插入的行数
+def insert_ignore(table, rows):
+    if not rows:
+        return 0
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table).values(rows).on_conflict_do_nothing()
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table).values(rows).on_conflict_do_nothing()
+    elif dialect == 'mysql':
+        statement = table.insert().values(rows).prefix_with('IGNORE')
+    else:
+        statement = table.insert().values(rows)
+    return db.session.execute(statement).rowcount
+
+
+'''
+给照片批量添加标签，names中的标签名按出现顺序去重：
+一条IN查询找出已有的标签，不存在的标签用insert_ignore一次插入后再查询一次id，
+照片已有的标签用一条查询排除，新的关联记录一次插入，受影响标签的photo_count用一条UPDATE增加，最后只提交一次。
+直接写入tagging表不会经过Photo.tags，before_flush中的标签计数不会执行，计数在这里更新。返回新添加的标签数量。
+'''
+def attach_tags(photo, names):
+    names = list(dict.fromkeys(names))
+    if not names:
+        return 0
+
+    tags = dict(db.session.query(Tag.name, Tag.id).filter(Tag.name.in_(names)))
+    missing = [name for name in names if name not in tags]
+    if missing:
+        insert_ignore(Tag.__table__, [{'name': name, 'photo_count': 0} for name in missing])
+        tags.update(db.session.query(Tag.name, Tag.id).filter(Tag.name.in_(missing)))
+
+    tag_ids = set(tags.values())
+    attached = db.session.execute(
+        select(tagging.c.tag_id).where(tagging.c.photo_id == photo.id, tagging.c.tag_id.in_(tag_ids))
+    ).scalars().all()
+    new_ids = tag_ids - set(attached)
+    inserted = insert_ignore(tagging, [{'photo_id': photo.id, 'tag_id': tag_id} for tag_id in new_ids])
+    if new_ids:
+        if inserted == len(new_ids):
+            Tag.query.filter(Tag.id.in_(new_ids)) \
+                .update({'photo_count': Tag.photo_count + 1}, synchronize_session=False)
+        else:
+            # 与其他请求同时添加了相同的标签，无法确定哪些行是本次插入的，直接重新统计
+            recount_tags(new_ids)
+        record_tag_changes(len(new_ids))
+
+    db.session.expire(photo, ['tags'])
+    db.session.commit()
+    return len(new_ids)
+
+
+# 标签是否还有照片，只检查是否存在关联记录，不加载照片
+def tag_in_use(tag_id):
+    return db.session.query(select(tagging.c.tag_id).where(tagging.c.tag_id == tag_id).exists()).scalar()
+
+
+# 没有关联记录的标签
+def _unused():
+    return ~select(tagging.c.tag_id).where(tagging.c.tag_id == Tag.id).exists()
+
+
+# 从照片上移除标签：一条DELETE删除关联记录并减少标签的照片数量，标签不再有照片时一并删除，只提交一次。
+# 删除标签的条件与是否还有照片在同一条DELETE ... WHERE NOT EXISTS中判断，
+# 先查询再删除时，其他请求可能在两条语句之间给这个标签添加了照片
+def detach_tag(photo, tag):
+    deleted = db.session.execute(
+        tagging.delete().where(tagging.c.photo_id == photo.id, tagging.c.tag_id == tag.id)
+    ).rowcount
+    if deleted:
+        Tag.query.filter_by(id=tag.id).update({'photo_count': Tag.photo_count - deleted}, synchronize_session=False)
+        record_tag_changes(deleted)
+        Tag.query.filter(Tag.id == tag.id, _unused()).delete(synchronize_session=False)
+    db.session.expire(photo, ['tags'])
+    db.session.commit()
+    return deleted
+
+
+# 删除所有没有照片的标签（例如照片被删除后留下的标签），一条DELETE ... WHERE NOT EXISTS语句，不提交
+def delete_orphan_tags():
+    return Tag.query.filter(_unused()).delete(synchronize_session=False)
+
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+
+from albumy.extensions import db, cache
+
+
+TRENDING_KEY = 'albumy:trending-tags'
+CHANGES_KEY = 'albumy:trending-changes'
+
+TrendingTag = namedtuple('TrendingTag', ['id', 'name', 'photo_count'])
+
+'''
+首页侧边栏的热门标签，所有用户看到的都一样，不需要每次渲染都统计tagging表：
+结果保存在共享缓存中（多个工作进程之间可以使用FileSystemCache共享），超时ALBUMY_TRENDING_TIMEOUT秒后重新计算；
+标签的增删累计达到ALBUMY_TRENDING_RECOMPUTE_AFTER次后提前失效；也可以由定时任务执行flask trending主动刷新。
+每个进程在内存中再保留ALBUMY_TRENDING_LOCAL_TIMEOUT秒，这段时间内不访问共享缓存。
+默认按Tag.photo_count排序；设置ALBUMY_TRENDING_HALF_LIFE（天）后按时间衰减的分数排序，每张照片的权重每过一个半衰期减半。
+'''
+_lock = threading.Lock()
+_local = (0, None) # (过期时间, 标签列表)
+
+
+def _by_count(limit):
+    from albumy.models import Tag
+
+    tags = Tag.query.filter(Tag.photo_count > 0).order_by(Tag.photo_count.desc(), Tag.id).limit(limit)
+    return [TrendingTag(tag.id, tag.name, tag.photo_count) for tag in tags]
+
+
+# 只统计最近四个半衰期内的照片，更早照片的权重已不足1/16
+def _by_decay(limit, half_life):
+    from albumy.models import Photo, Tag, tagging
+
+    now = datetime.utcnow()
+    rows = db.session.query(tagging.c.tag_id, Photo.timestamp) \
+                .join(Photo, Photo.id == tagging.c.photo_id) \
+                .filter(Photo.timestamp >= now - timedelta(days=half_life * 4))
+    scores = {}
+    for tag_id, timestamp in rows:
+        age = (now - timestamp).total_seconds() / 86400.0
+        scores[tag_id] = scores.get(tag_id, 0) + 0.5 ** (age / half_life)
+    top = sorted(scores, key=lambda tag_id: (-scores[tag_id], tag_id))[:limit]
+    tags = {tag.id: tag for tag in Tag.query.filter(Tag.id.in_(top))} if top else {}
+    trending = [TrendingTag(tags[id].id, tags[id].name, tags[id].photo_count) for id in top if id in tags]
+    # 最近没有新照片的标签不够时，用照片总数最多的标签补足
+    if len(trending) < limit:
+        trending.extend(tag for tag in _by_count(limit) if tag.id not in scores)
+    return trending[:limit]
+
+
+def compute_trending_tags():
+    limit = current_app.config['ALBUMY_TRENDING_TAGS']
+    half_life = current_app.config['ALBUMY_TRENDING_HALF_LIFE']
+    if half_life:
+        return _by_decay(limit, half_life)
+    return _by_count(limit)
+
+
+# 重新计算并写入共享缓存
+def refresh_trending_tags():
+    global _local
+    tags = compute_trending_tags()
+    cache.set(TRENDING_KEY, tags, timeout=current_app.config['ALBUMY_TRENDING_TIMEOUT'])
+    cache.set(CHANGES_KEY, 0, timeout=0)
+    with _lock:
+        _local = (time.time() + current_app.config['ALBUMY_TRENDING_LOCAL_TIMEOUT'], tags)
+    return tags
+
+
+def trending_tags():
+    global _local
+    expires, tags = _local
+    if tags is not None and expires > time.time():
+        return tags
+    tags = cache.get(TRENDING_KEY)
+    if tags is None:
+        return refresh_trending_tags()
+    with _lock:
+        _local = (time.time() + current_app.config['ALBUMY_TRENDING_LOCAL_TIMEOUT'], tags)
+    return tags
+
+
+# 记录标签变化次数，在事务提交之后才计入，回滚的修改不会使缓存失效
+def record_tag_changes(count, session=None):
+    if not count:
+        return
+    if session is None:
+        session = db.session()
+    session.info['albumy_tag_changes'] = session.info.get('albumy_tag_changes', 0) + count
+
+
+# 累计标签变化次数，达到阈值后使共享缓存失效
+def _count_tag_changes(count):
+    global _local
+    if not has_app_context():
+        return
+    changes = cache.cache.inc(CHANGES_KEY, count)
+    if changes is not None and changes >= current_app.config['ALBUMY_TRENDING_RECOMPUTE_AFTER']:
+        cache.delete(TRENDING_KEY)
+        cache.set(CHANGES_KEY, 0, timeout=0)
+        with _lock:
+            _local = (0, None)
+
+
+@db.event.listens_for(db.Session, 'after_commit')
+def apply_tag_changes(session):
+    count = session.info.pop('albumy_tag_changes', 0)
+    if count:
+        _count_tag_changes(count)
+
+
+@db.event.listens_for(db.Session, 'after_rollback')
+def discard_tag_changes(session):
+    session.info.pop('albumy_tag_changes', None)
@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from albumy.extensions import db, cache, cache_is_shared
+
+
+USER_KEY = 'albumy:user:%d'
+
+# 快照中保存的字段：认证、权限判断和导航栏需要的字段，其余字段在第一次访问时才从数据库加载
+USER_FIELDS = (
+    'id', 'username', 'email', 'name', 'role_id', 'confirmed', 'locked', 'active',
+    'avatar_s', 'avatar_m', 'avatar_l', 'unread_notification_count'
+)
+
+'''
+Flask-Login的用户加载：每个已登录的请求都要执行一次load_user()，原来每次都查询user表。
+现在把用户的字段快照（USER_FIELDS）保存在共享缓存中，超时ALBUMY_USER_CACHE_TIMEOUT秒；每个进程在内存中再保留
+ALBUMY_USER_CACHE_LOCAL_TIMEOUT秒，最多ALBUMY_USER_CACHE_LOCAL_SIZE个，超过后淘汰最久没有使用的快照。加载时用快照构造一个User对象并以merge(load=False)的方式放入会话，不执行SQL；
+角色与权限来自permissions模块中按角色缓存的映射。快照之外的字段在第一次访问时由SQLAlchemy一次加载。
+用户记录修改、删除，或者未读通知数量变化时，在事务提交之后删除对应的快照，见mark_user_stale()和invalidate_user()。
+快照中有锁定、封禁、角色等认证状态，必须能在所有工作进程中同时失效，所以只有配置了共享的缓存后端时才使用快照：
+SimpleCache、NullCache只在当前进程中有效，这时（以及ALBUMY_USER_CACHE_TIMEOUT为0时）每个请求都查询数据库。
+'''
+_lock = threading.Lock()
+_local = OrderedDict() # 用户id -> (过期时间, 快照)，按最近使用的顺序排列
+
+
+def _snapshot(user):
+    return {field: getattr(user, field) for field in USER_FIELDS}
+
+
+def _restore(snapshot):
+    from albumy.models import User
+
+    user = User.__mapper__.class_manager.new_instance()
+    for field, value in snapshot.items():
+        set_committed_value(user, field, value)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def _enabled():
+    if not current_app.config['ALBUMY_USER_CACHE_TIMEOUT']:
+        return False
+    return cache_is_shared()
+
+
+def _get_local(user_id):
+    with _lock:
+        expires, snapshot = _local.get(user_id, (0, None))
+        if snapshot is None:
+            return None
+        if expires <= time.time():
+            del _local[user_id]
+            return None
+        _local.move_to_end(user_id)
+        return snapshot
+
+
+def _set_local(user_id, snapshot):
+    expires = time.time() + current_app.config['ALBUMY_USER_CACHE_LOCAL_TIMEOUT']
+    with _lock:
+        _local[user_id] = (expires, snapshot)
+        _local.move_to_end(user_id)
+        while len(_local) > current_app.config['ALBUMY_USER_CACHE_LOCAL_SIZE']:
+            _local.popitem(last=False)
+
+
+def _get_snapshot(user_id):
+    snapshot = _get_local(user_id)
+    if snapshot is not None:
+        return snapshot
+    snapshot = cache.get(USER_KEY % user_id)
+    if snapshot is not None:
+        _set_local(user_id, snapshot)
+    return snapshot
+
+
+def _set_snapshot(user):
+    snapshot = _snapshot(user)
+    cache.set(USER_KEY % user.id, snapshot, timeout=current_app.config['ALBUMY_USER_CACHE_TIMEOUT'])
+    _set_local(user.id, snapshot)
+
+
+def load_cached_user(user_id):
+    from albumy.models import User
+
+    if not _enabled():
+        return User.query.get(user_id)
+    snapshot = _get_snapshot(user_id)
+    if snapshot is not None:
+        return _restore(snapshot)
+    user = User.query.get(user_id)
+    if user is not None:
+        _set_snapshot(user)
+    return user
+
+
+# 删除用户的快照，在修改已经提交之后调用
+def invalidate_user(*user_ids):
+    for user_id in user_ids:
+        cache.delete(USER_KEY % user_id)
+    with _lock:
+        for user_id in user_ids:
+            _local.pop(user_id, None)
+
+
+# 在模型事件中调用：记录需要删除快照的用户，等事务提交后再删除，避免其他请求在提交之前又读取到旧数据写入缓存
+def mark_user_stale(target, user_id):
+    session = object_session(target)
+    if session is None:
+        invalidate_user(user_id)
+    else:
+        session.info.setdefault('albumy_stale_users', set()).add(user_id)
+
+
+@db.event.listens_for(db.Session, 'after_commit')
+def invalidate_stale_users(session):
+    user_ids = session.info.pop('albumy_stale_users', None)
+    if user_ids:
+        invalidate_user(*user_ids)
+
+
+@db.event.listens_for(db.Session, 'after_rollback')
+def discard_stale_users(session):
+    session.info.pop('albumy_stale_users', None)
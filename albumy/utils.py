@@ -2,7 +2,7 @@ import os
 
 from urllib.parse import urlparse, urljoin
 from PIL import Image
-from flask import current_app, request, redirect, url_for, flash
+from flask import current_app, request, redirect, url_for, flash, send_from_directory
 from itsdangerous.jws import TimedJSONWebSignatureSerializer as Serializer
 from itsdangerous import BadSignature, SignatureExpired
 
@@ -42,20 +42,56 @@ def validate_token(user, token, operation, new_password=None):
     return True
 
 
-def resize_image(image, filename, base_width):
-    filename, ext = os.path.splitext(filename)
-    img = Image.open(image)
-    if img.size[0] <= base_width:
-        return filename + ext
-    w_percent = (base_width / float(img.size[0]))
-    h_size = int(float(img.size[1]) * float(w_percent))
-    img = img.resize((base_width, h_size), Image.ANTIALIAS)
+'''
+为原图生成多个宽度的缩略图，sizes为{宽度: 文件名后缀}，返回{宽度: 文件名}，原图宽度不超过目标宽度时直接使用原图文件名。
+原图只解码一次：对于JPEG，先调用draft()让libjpeg在解码时按1/2、1/4、1/8的比例缩小（不小于最大的目标尺寸），
+然后从大到小依次缩放，每个尺寸都从上一个尺寸的结果缩放得到。缩略图与原图保存在同一目录，不依赖应用上下文，可以在进程池中调用。
+'''
+def make_thumbnails(path, sizes):
+    directory, filename = os.path.split(path)
+    name, ext = os.path.splitext(filename)
+    thumbnails = {}
+    with Image.open(path) as img:
+        width, height = img.size
+        targets = sorted((w for w in sizes if w < width), reverse=True)
+        for w in sizes:
+            if w >= width:
+                thumbnails[w] = filename
+        if not targets:
+            return thumbnails
 
-    filename += current_app.config['ALBUMY_PHOTO_SUFFIX'][base_width] + ext
-    img.save(os.path.join(current_app.config['ALBUMY_UPLOAD_PATH'], filename))
-    return filename
+        img.draft(img.mode, (targets[0], int(height * targets[0] / width)))
+        current = img
+        for w in targets:
+            h = int(float(height) * (w / float(width)))
+            current = current.resize((w, h), Image.LANCZOS)
+            thumbnails[w] = name + sizes[w] + ext
+            current.save(os.path.join(directory, thumbnails[w]))
+    return thumbnails
     
 
+'''
+发送文件名不会复用的文件（上传的照片使用随机文件名，头像文件名由内容生成），浏览器和代理可以永久缓存：
+ETag、Last-Modified由send_file根据文件生成，带If-None-Match/If-Modified-Since的请求返回304；
+设置USE_X_SENDFILE后由Apache/lighttpd等前端服务器发送文件内容；
+设置ALBUMY_ACCEL_REDIRECT_PATH（Nginx中对应ALBUMY_UPLOAD_PATH的internal location）后由Nginx发送文件内容。
+'''
+def send_immutable(directory, filename):
+    response = send_from_directory(directory, filename, etag=True, max_age=current_app.config['ALBUMY_IMMUTABLE_MAX_AGE'])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+
+    accel_path = current_app.config['ALBUMY_ACCEL_REDIRECT_PATH']
+    if accel_path and response.status_code == 200 and not current_app.use_x_sendfile:
+        path = os.path.relpath(os.path.join(directory, filename), current_app.config['ALBUMY_UPLOAD_PATH'])
+        if not path.startswith(os.pardir):
+            response.close()
+            response.response = []
+            response.headers.pop('Content-Length', None)
+            response.headers['X-Accel-Redirect'] = accel_path.rstrip('/') + '/' + path.replace(os.sep, '/')
+    return response
+
+
 def is_safe_url(target):
     ref_url = urlparse(request.host_url)
     test_url = urlparse(urljoin(request.host_url, target))
@@ -0,0 +1,98 @@
+"""
+探索页随机照片基准测试：对比ORDER BY RANDOM() LIMIT 12与albumy.explore的按id随机抽取、id池三种方式在不同照片数量下的耗时。
+
+    python benchmarks/explore.py                                  # SQLite临时数据库，1万~100万张照片
+    python benchmarks/explore.py --sizes 10000,100000,1000000,10000000
+    python benchmarks/explore.py --database postgresql://localhost/albumy_bench
+
+照片表按数量从小到大依次填充，随机删除--gaps比例的照片模拟id空洞。使用--database时会清空并重建该数据库中的表。
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BATCH_SIZE = 50000
+
+
+def fill(db, Photo, start, stop, gaps):
+    from sqlalchemy import insert
+    for offset in range(start, stop, BATCH_SIZE):
+        rows = [
+            {'id': i + 1, 'filename': 'photo_%d.jpg' % i, 'filename_s': 'photo_%d_s.jpg' % i, 'filename_m': 'photo_%d_m.jpg' % i}
+            for i in range(offset, min(offset + BATCH_SIZE, stop))
+            if random.random() >= gaps
+        ]
+        db.session.execute(insert(Photo.__table__), rows)
+        db.session.commit()
+
+
+def timeit(func, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        photos = func()
+        times.append((time.perf_counter() - start) * 1000)
+        assert len(photos) == 12, len(photos)
+    return statistics.median(times), max(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='Comma separated photo counts.')
+    parser.add_argument('--database', help='Database URI, a temporary SQLite database is used if omitted.')
+    parser.add_argument('--gaps', type=float, default=0.1, help='Fraction of deleted ids, default is 0.1.')
+    parser.add_argument('--repeat', type=int, default=10, help='Runs per sampler, default is 10.')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='albumy-bench-')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = args.database or 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    try:
+        from albumy import create_app
+        from albumy.extensions import db, cache
+        from albumy.models import Photo
+        from albumy.explore import explore_photos
+
+        app = create_app('testing')
+        # 测试配置固定使用内存数据库，这里改为命令行指定的数据库
+        app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['SQLALCHEMY_DATABASE_URI']
+        app.config['ALBUMY_EXPLORE_POOL_SIZE'] = 1000
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+            def order_by_random():
+                return Photo.query.order_by(db.func.random()).limit(12).all()
+
+            def probe():
+                app.config['ALBUMY_EXPLORE_POOL_SIZE'] = 0
+                return explore_photos(12)
+
+            def pool():
+                app.config['ALBUMY_EXPLORE_POOL_SIZE'] = 1000
+                return explore_photos(12)
+
+            samplers = [('order_by_random', order_by_random), ('id_probe', probe), ('id_pool', pool)]
+            print('%-10s %-16s %12s %12s' % ('photos', 'sampler', 'median (ms)', 'max (ms)'))
+            filled = 0
+            for size in sorted(int(s) for s in args.sizes.split(',')):
+                fill(db, Photo, filled, size, args.gaps)
+                filled = size
+                for name, func in samplers:
+                    cache.clear()
+                    func()  # 预热：填充id范围和id池缓存
+                    median, worst = timeit(func, args.repeat)
+                    print('%-10d %-16s %12.2f %12.2f' % (size, name, median, worst))
+                    db.session.rollback()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+通知写入基准测试：模拟一张热门照片在短时间内收到大量收藏，对比旧的push_collect_notification（每个事件插入一条记录并提交）
+与合并、批量写入之后的吞吐量。
+
+    python benchmarks/notifications.py                         # SQLite临时数据库，10000个收藏事件
+    python benchmarks/notifications.py --events 50000 --photos 20
+    python benchmarks/notifications.py --database postgresql://localhost/albumy_bench
+
+使用--database时会清空并重建该数据库中的表。
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# 旧实现：每个事件一条INSERT和一次提交
+def legacy_push_collect_notification(collector, photo_id, receiver):
+    from flask import url_for
+    from albumy.extensions import db
+    from albumy.models import Notification
+
+    message = 'User <a href="%s">%s</a> collected your <a href="%s">photo</a>' % (
+                url_for('user.index', username=collector.username),
+                collector.username,
+                url_for('main.show_photo', photo_id=photo_id)
+        )
+    notification = Notification(message=message, receiver=receiver)
+    db.session.add(notification)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=10000, help='Collect events in the burst, default is 10000.')
+    parser.add_argument('--users', type=int, default=2000, help='Distinct collectors, default is 2000.')
+    parser.add_argument('--photos', type=int, default=5, help='Photos receiving the collects, default is 5.')
+    parser.add_argument('--database', help='Database URI, a temporary SQLite database is used if omitted.')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='albumy-bench-')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = args.database or 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    try:
+        from albumy import create_app
+        from albumy.extensions import db
+        from albumy.models import Notification, User
+        from albumy.notifications import notification_aggregator, push_collect_notification
+
+        app = create_app('testing')
+        # 测试配置固定使用内存数据库，这里改为命令行指定的数据库
+        app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['SQLALCHEMY_DATABASE_URI']
+        # 创建用户时会生成头像，写入临时目录而不是仓库中的uploads目录
+        app.config['ALBUMY_UPLOAD_PATH'] = workdir
+        app.config['AVATARS_SAVE_PATH'] = workdir
+        # 测试期间不按时间写入，只在缓冲区满时写入，最后手动写入剩余部分
+        app.config['ALBUMY_NOTIFICATION_FLUSH_INTERVAL'] = 3600
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            users = [User(username='user%d' % i, email='user%d@example.com' % i) for i in range(args.users + 1)]
+            db.session.add_all(users)
+            db.session.commit()
+            receiver, collectors = users[0], users[1:]
+            events = [(random.choice(collectors), random.randint(1, args.photos)) for i in range(args.events)]
+
+            def legacy():
+                for collector, photo_id in events:
+                    legacy_push_collect_notification(collector, photo_id, receiver)
+
+            def aggregated():
+                for collector, photo_id in events:
+                    push_collect_notification(collector, photo_id, receiver)
+                notification_aggregator.flush()
+
+            print('%-12s %12s %14s %10s' % ('impl', 'time (s)', 'events/sec', 'rows'))
+            for name, func in [('legacy', legacy), ('aggregated', aggregated)]:
+                Notification.query.delete()
+                db.session.commit()
+                with app.test_request_context():
+                    start = time.perf_counter()
+                    func()
+                    elapsed = time.perf_counter() - start
+                rows = Notification.query.count()
+                print('%-12s %12.3f %14.0f %10d' % (name, elapsed, args.events / elapsed, rows))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
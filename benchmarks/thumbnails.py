@@ -0,0 +1,144 @@
+"""
+缩略图生成基准测试：对比旧的resize_image（每个尺寸各解码一次原图）与utils.make_thumbnails（解码一次，JPEG使用draft()）
+的耗时和峰值内存。
+
+    python benchmarks/thumbnails.py                      # 生成12MP~24MP的测试图片
+    python benchmarks/thumbnails.py --corpus ~/photos    # 使用已有的JPEG图片
+
+每种实现在单独的子进程中运行，峰值内存取子进程的VmHWM（非Linux系统使用ru_maxrss）。
+"""
+import argparse
+import glob
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SIZES = {400: '_s', 800: '_m'}
+MEGAPIXELS = (12, 16, 20, 24)
+
+
+# 旧实现：每个目标尺寸都重新打开并完整解码原图
+def legacy_thumbnails(path, sizes):
+    directory, filename = os.path.split(path)
+    name, ext = os.path.splitext(filename)
+    thumbnails = {}
+    for base_width, suffix in sizes.items():
+        img = Image.open(path)
+        if img.size[0] <= base_width:
+            thumbnails[base_width] = filename
+            continue
+        w_percent = (base_width / float(img.size[0]))
+        h_size = int(float(img.size[1]) * float(w_percent))
+        img = img.resize((base_width, h_size), Image.LANCZOS)
+        thumbnails[base_width] = name + suffix + ext
+        img.save(os.path.join(directory, thumbnails[base_width]))
+    return thumbnails
+
+
+def engine_thumbnails(path, sizes):
+    from albumy.utils import make_thumbnails
+    return make_thumbnails(path, sizes)
+
+
+IMPLEMENTATIONS = {
+    'legacy': legacy_thumbnails,
+    'engine': engine_thumbnails
+}
+
+
+def make_corpus(directory, count):
+    paths = []
+    for i in range(count):
+        megapixels = MEGAPIXELS[i % len(MEGAPIXELS)]
+        width = int((megapixels * 1000000 * 4 / 3) ** 0.5)
+        height = int(width * 3 / 4)
+        bands = [Image.effect_noise((width, height), sigma) for sigma in (40, 60, 80)]
+        img = Image.merge('RGB', bands)
+        path = os.path.join(directory, 'photo_%d_%dmp.jpg' % (i, megapixels))
+        img.save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+# 峰值内存（KB）。ru_maxrss会保留fork时父进程的内存占用，所以优先读取exec之后重新计算的VmHWM
+def peak_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# 子进程入口：处理全部图片后输出耗时和峰值内存（KB）
+def run(implementation, paths):
+    # 先导入依赖，避免把导入时间计入
+    if implementation == 'engine':
+        import albumy.utils
+    func = IMPLEMENTATIONS[implementation]
+    start = time.perf_counter()
+    for path in paths:
+        func(path, SIZES)
+    elapsed = time.perf_counter() - start
+    print('%f %d' % (elapsed, peak_rss()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='Directory of JPEG files, a synthetic corpus is generated if omitted.')
+    parser.add_argument('--count', type=int, default=12, help='Synthetic images to generate, default is 12.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per implementation, default is 3.')
+    parser.add_argument('--run', choices=IMPLEMENTATIONS, help=argparse.SUPPRESS)
+    parser.add_argument('paths', nargs='*', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run, args.paths)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='albumy-bench-')
+    try:
+        if args.corpus:
+            sources = sorted(glob.glob(os.path.join(args.corpus, '*.jp*g')))
+        else:
+            print('Generating %d synthetic photos...' % args.count)
+            sources = make_corpus(workdir, args.count)
+        print('Corpus: %d photos, %.1f MB' % (len(sources), sum(os.path.getsize(p) for p in sources) / 1048576.0))
+
+        results = {}
+        for implementation in IMPLEMENTATIONS:
+            runs = []
+            for i in range(args.repeat):
+                # 每次运行使用原图的副本，缩略图写入临时目录
+                rundir = tempfile.mkdtemp(dir=workdir)
+                paths = []
+                for source in sources:
+                    paths.append(os.path.join(rundir, os.path.basename(source)))
+                    shutil.copyfile(source, paths[-1])
+                output = subprocess.check_output([sys.executable, __file__, '--run', implementation] + paths)
+                elapsed, maxrss = output.split()
+                runs.append((float(elapsed), int(maxrss)))
+                shutil.rmtree(rundir)
+            results[implementation] = (min(r[0] for r in runs), max(r[1] for r in runs))
+
+        print('%-8s %12s %12s %14s' % ('impl', 'total (s)', 'per photo', 'peak RSS (MB)'))
+        for implementation, (elapsed, maxrss) in results.items():
+            print('%-8s %12.3f %12.3f %14.1f' % (implementation, elapsed, elapsed / len(sources), maxrss / 1024.0))
+        legacy, engine = results['legacy'], results['engine']
+        print('speedup: %.2fx, peak RSS: %.2fx' % (legacy[0] / engine[0], engine[1] / float(legacy[1])))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
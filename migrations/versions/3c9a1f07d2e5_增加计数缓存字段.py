@@ -0,0 +1,37 @@
+"""增加计数缓存字段
+
+Revision ID: 3c9a1f07d2e5
+Revises: 2bf08b2224bf
+Create Date: 2026-10-18 10:12:31.284106
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9a1f07d2e5'
+down_revision = '2bf08b2224bf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有数据的计数为0，升级后需要执行flask recount重建
+    op.add_column('photo', sa.Column('collect_count', sa.Integer(), server_default='0', nullable=True))
+    op.add_column('photo', sa.Column('comment_count', sa.Integer(), server_default='0', nullable=True))
+    op.add_column('tag', sa.Column('photo_count', sa.Integer(), server_default='0', nullable=True))
+    op.add_column('user', sa.Column('photo_count', sa.Integer(), server_default='0', nullable=True))
+    op.add_column('user', sa.Column('collection_count', sa.Integer(), server_default='0', nullable=True))
+    op.add_column('user', sa.Column('follower_count', sa.Integer(), server_default='0', nullable=True))
+    op.add_column('user', sa.Column('following_count', sa.Integer(), server_default='0', nullable=True))
+
+
+def downgrade():
+    op.drop_column('user', 'following_count')
+    op.drop_column('user', 'follower_count')
+    op.drop_column('user', 'collection_count')
+    op.drop_column('user', 'photo_count')
+    op.drop_column('tag', 'photo_count')
+    op.drop_column('photo', 'comment_count')
+    op.drop_column('photo', 'collect_count')
@@ -0,0 +1,29 @@
+"""增加未读通知计数
+
+Revision ID: d94b1e27c6a8
+Revises: c5a8f3e06b14
+Create Date: 2026-10-18 20:05:12.873420
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd94b1e27c6a8'
+down_revision = 'c5a8f3e06b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有数据的计数为0，升级后需要执行flask recount重建
+    op.add_column('user', sa.Column('unread_notification_count', sa.Integer(), server_default='0', nullable=True))
+    # 部分索引，只包含未读通知（MySQL不支持部分索引，会创建普通索引）
+    op.create_index('ix_notification_receiver_id_unread', 'notification', ['receiver_id'], unique=False,
+                    postgresql_where=sa.text('is_read = false'), sqlite_where=sa.text('is_read = 0'))
+
+
+def downgrade():
+    op.drop_index('ix_notification_receiver_id_unread', table_name='notification')
+    op.drop_column('user', 'unread_notification_count')
@@ -0,0 +1,32 @@
+"""标签关联增加唯一约束
+
+Revision ID: e3f7a2b58d91
+Revises: d94b1e27c6a8
+Create Date: 2026-10-18 21:12:48.330915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3f7a2b58d91'
+down_revision = 'd94b1e27c6a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 先去掉重复的关联记录，去重后标签的照片数量可能变化，升级后需要执行flask recount重建
+    op.execute('CREATE TABLE tagging_dedup AS SELECT DISTINCT photo_id, tag_id FROM tagging')
+    op.execute('DELETE FROM tagging')
+    op.execute('INSERT INTO tagging (photo_id, tag_id) SELECT photo_id, tag_id FROM tagging_dedup')
+    op.execute('DROP TABLE tagging_dedup')
+    # SQLite不支持ALTER TABLE添加约束，使用batch模式重建表
+    with op.batch_alter_table('tagging') as batch_op:
+        batch_op.create_unique_constraint('uq_tagging_photo_id_tag_id', ['photo_id', 'tag_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('tagging') as batch_op:
+        batch_op.drop_constraint('uq_tagging_photo_id_tag_id', type_='unique')
@@ -0,0 +1,52 @@
+import shutil
+import tempfile
+import unittest
+
+from albumy import create_app
+from albumy.extensions import db
+from albumy.models import Role, User
+
+
+class BaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        app = create_app('testing')
+        # 头像、照片写入临时目录，测试结束后删除
+        self.upload_path = tempfile.mkdtemp()
+        app.config.update(
+            SECRET_KEY='testing',
+            ALBUMY_ADMIN_EMAIL='admin@helloflask.com',
+            ALBUMY_UPLOAD_PATH=self.upload_path,
+            AVATARS_SAVE_PATH=self.upload_path,
+            ALBUMY_DERIVATIVE_PATH=self.upload_path
+        )
+        self.app = app
+        self.context = app.test_request_context()
+        self.context.push()
+        self.client = app.test_client()
+        self.runner = app.test_cli_runner()
+
+        db.create_all()
+        Role.init_role()
+
+        admin = User(email='admin@helloflask.com', name='Admin', username='admin', confirmed=True)
+        admin.set_password('123')
+        normal = User(email='normal@helloflask.com', name='Normal User', username='normal', confirmed=True)
+        normal.set_password('123')
+        db.session.add_all([admin, normal])
+        db.session.commit()
+
+    def tearDown(self):
+        db.drop_all()
+        db.session.remove()
+        self.context.pop()
+        shutil.rmtree(self.upload_path, ignore_errors=True)
+
+    def login(self, email=None, password=None):
+        if email is None and password is None:
+            email = 'normal@helloflask.com'
+            password = '123'
+        return self.client.post('/auth/login', data=dict(email=email, password=password), follow_redirects=True)
+
+    def logout(self):
+        return self.client.get('/auth/logout', follow_redirects=True)
@@ -0,0 +1,23 @@
+from albumy.extensions import db
+from albumy.models import User
+from tests.base import BaseTestCase
+
+
+class ManageUserTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for username in ('norman', 'nor%x', 'other'):
+            db.session.add(User(email='%s@example.com' % username, name=username, username=username))
+        db.session.commit()
+        self.login(email='admin@helloflask.com', password='123')
+
+    def search(self, q):
+        data = self.client.get('/admin/manage/user', query_string={'q': q}).get_data(as_text=True)
+        return {user.username for user in User.query if '<br>%s</td>' % user.username in data}
+
+    def test_prefix_search(self):
+        self.assertEqual(self.search('nor'), {'normal', 'norman', 'nor%x'})
+        self.assertEqual(self.search('norm'), {'normal', 'norman'})
+        self.assertEqual(self.search('nor%'), {'nor%x'})
+        self.assertEqual(self.search('OTHER@'), {'other'})
@@ -0,0 +1,35 @@
+from albumy.comments import comment_page
+from albumy.extensions import cache, db
+from albumy.models import Comment, Photo, User
+from tests.base import BaseTestCase
+
+
+class CommentPageTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.query.filter_by(username='normal').first()
+        self.photo = Photo(filename='a.jpg', author=self.author)
+        db.session.add(self.photo)
+        db.session.add(Comment(body='first', photo=self.photo, author=self.author))
+        db.session.commit()
+
+    def tearDown(self):
+        cache.init_app(self.app)
+        super().tearDown()
+
+    def add_comment_in_other_process(self):
+        # 其他进程新增评论时只能使它自己的进程内缓存失效
+        db.session.add(Comment(body='second', photo=self.photo, author=self.author))
+        db.session.commit()
+
+    def test_process_local_cache_is_not_used(self):
+        self.assertEqual(len(comment_page(self.photo, 1, 10).items), 1)
+        self.add_comment_in_other_process()
+        self.assertEqual(len(comment_page(self.photo, 1, 10).items), 2)
+
+    def test_shared_cache_is_used(self):
+        cache.init_app(self.app, config={'CACHE_TYPE': 'FileSystemCache', 'CACHE_DIR': self.upload_path})
+        self.assertEqual(len(comment_page(self.photo, 1, 10).items), 1)
+        self.add_comment_in_other_process()
+        self.assertEqual(len(comment_page(self.photo, 1, 10).items), 1)
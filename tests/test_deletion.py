@@ -0,0 +1,43 @@
+import os
+
+from albumy.deletion import purge_user, sweep_pending_deletions
+from albumy.extensions import db
+from albumy.models import Comment, PendingDeletion, Photo, User
+from tests.base import BaseTestCase
+
+
+class DeletionTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.query.filter_by(username='admin').first()
+        self.normal = User.query.filter_by(username='normal').first()
+        self.photo = Photo(filename='a.jpg', filename_s='a_s.jpg', filename_m='a_m.jpg', author=self.admin)
+        db.session.add(self.photo)
+        db.session.commit()
+
+    def test_purge_user_comment_threads(self):
+        for i in range(5):
+            comment = Comment(body='comment', author=self.normal, photo=self.photo)
+            reply = Comment(body='reply', author=self.admin, photo=self.photo, replied=comment)
+            db.session.add(Comment(body='reply to reply', author=self.admin, photo=self.photo, replied=reply))
+        kept = Comment(body='kept', author=self.admin, photo=self.photo)
+        db.session.add(kept)
+        db.session.commit()
+
+        purge_user(self.normal.id, batch_size=2)
+        self.assertEqual([comment.id for comment in Comment.query], [kept.id])
+        self.assertEqual(Photo.query.get(self.photo.id).comment_count, 1)
+        self.assertIsNone(User.query.filter_by(username='normal').first())
+
+    def test_sweep_missing_files(self):
+        path = os.path.join(self.upload_path, 'a.jpg')
+        open(path, 'wb').close()
+        db.session.add_all([PendingDeletion(kind='upload', target='a.jpg'),
+                            PendingDeletion(kind='upload', target='a.jpg'),
+                            PendingDeletion(kind='upload', target='missing.jpg')])
+        db.session.commit()
+
+        self.assertEqual(sweep_pending_deletions(), (0, 3))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(PendingDeletion.query.count(), 0)
@@ -0,0 +1,52 @@
+import os
+from unittest import mock
+
+from PIL import Image
+
+from albumy import derivatives
+from tests.base import BaseTestCase
+
+
+class DerivativeTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['ALBUMY_DERIVATIVE_PATH'] = os.path.join(self.upload_path, 'derivatives')
+        derivatives._cache_size = None
+        for i in range(3):
+            Image.new('RGB', (600, 400), (i * 80, 0, 0)).save(os.path.join(self.upload_path, '%d.png' % i))
+
+    def tearDown(self):
+        derivatives._cache_size = None
+        super().tearDown()
+
+    def test_generate_preset(self):
+        response = self.client.get('/uploads/grid/0.png')
+        self.assertEqual(response.status_code, 200)
+        path = os.path.join(self.app.config['ALBUMY_DERIVATIVE_PATH'], 'grid', '0.png')
+        with Image.open(path) as img:
+            self.assertEqual(img.size, (200, 133))
+
+    def test_source_is_not_an_image(self):
+        with open(os.path.join(self.upload_path, 'notes.png'), 'w') as f:
+            f.write('not an image')
+        self.assertEqual(self.client.get('/uploads/grid/notes.png').status_code, 404)
+
+    def test_directory_is_walked_only_over_the_limit(self):
+        walk = mock.Mock(side_effect=os.walk)
+        with mock.patch.object(derivatives.os, 'walk', walk):
+            for i in range(3):
+                self.assertEqual(self.client.get('/uploads/grid/%d.png' % i).status_code, 200)
+            self.assertEqual(walk.call_count, 1)
+
+            self.app.config['ALBUMY_DERIVATIVE_CACHE_SIZE'] = derivatives._cache_size
+            self.assertEqual(self.client.get('/uploads/small/0.png').status_code, 200)
+            self.assertEqual(walk.call_count, 2)
+        self.assertLessEqual(derivatives._cache_size, self.app.config['ALBUMY_DERIVATIVE_CACHE_SIZE'])
+        self.assertFalse(os.path.exists(os.path.join(self.app.config['ALBUMY_DERIVATIVE_PATH'], 'grid', '0.png')))
+
+    def test_evict_command(self):
+        self.client.get('/uploads/grid/0.png')
+        self.app.config['ALBUMY_DERIVATIVE_CACHE_SIZE'] = 0
+        result = self.runner.invoke(args=['derivatives', 'evict'])
+        self.assertIn('1 derivatives evicted.', result.output)
@@ -0,0 +1,33 @@
+from albumy.explore import explore_photos
+from albumy.extensions import cache, db
+from albumy.models import Photo, User
+from tests.base import BaseTestCase
+
+
+class ExploreTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        author = User.query.filter_by(username='normal').first()
+        db.session.add_all([Photo(filename='%d.jpg' % i, author=author) for i in range(20)])
+        db.session.commit()
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+        super().tearDown()
+
+    def test_random_photos(self):
+        photos = explore_photos(12)
+        self.assertEqual(len(photos), 12)
+        self.assertEqual(len({photo.id for photo in photos}), 12)
+
+    def test_pool_with_deleted_photos(self):
+        self.app.config['ALBUMY_EXPLORE_POOL_SIZE'] = 12
+        pool = {photo.id for photo in explore_photos(12)}
+        Photo.query.filter(Photo.id.in_(list(pool)[:6])).delete(synchronize_session=False)
+        db.session.commit()
+
+        photos = explore_photos(12)
+        self.assertEqual(len(photos), 12)
+        self.assertEqual(len({photo.id for photo in photos}), 12)
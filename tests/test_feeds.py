@@ -0,0 +1,42 @@
+from albumy.extensions import db
+from albumy.models import Photo, Timeline, User
+from tests.base import BaseTestCase
+
+
+class TimelineTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config.update(ALBUMY_FEED_MODE='push', ALBUMY_FEED_FANOUT_LIMIT=2)
+        self.author = User.query.filter_by(username='admin').first()
+        self.follower = User.query.filter_by(username='normal').first()
+        self.other = User(email='other@helloflask.com', name='Other', username='other')
+        db.session.add(self.other)
+        db.session.commit()
+
+    def entries(self, user):
+        return Timeline.query.filter_by(user_id=user.id, author_id=self.author.id).count()
+
+    def test_refill_after_author_drops_to_limit(self):
+        # 作者和两个关注者，共3个关注者超过上限，新照片不写入时间线
+        self.follower.follow(self.author)
+        self.other.follow(self.author)
+        db.session.add(Photo(filename='a.jpg', author=self.author))
+        db.session.commit()
+        self.assertEqual(self.entries(self.follower), 0)
+
+        # 取消关注后降回上限，提交之后补齐剩余关注者的时间线
+        self.other.unfollow(self.author)
+        self.assertEqual(self.entries(self.follower), 1)
+        self.assertEqual(self.entries(self.other), 0)
+
+    def test_refill_discarded_on_rollback(self):
+        self.follower.follow(self.author)
+        self.other.follow(self.author)
+        db.session.add(Photo(filename='a.jpg', author=self.author))
+        db.session.commit()
+
+        db.session.delete(self.other.following.filter_by(followed_id=self.author.id).first())
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.entries(self.follower), 0)
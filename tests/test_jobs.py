@@ -0,0 +1,57 @@
+import os
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from unittest import mock
+
+from PIL import Image
+
+from albumy.extensions import db
+from albumy.jobs import ThumbnailQueue
+from albumy.models import Photo, User
+from tests.base import BaseTestCase
+
+
+class BrokenExecutor:
+
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool()
+
+
+class ThumbnailQueueTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['ALBUMY_THUMBNAIL_MODE'] = 'pool'
+        self.queue = ThumbnailQueue(self.app)
+        author = User.query.filter_by(username='normal').first()
+        self.photos = []
+        for i, age in enumerate([timedelta(hours=1), timedelta(0)]):
+            filename = '%d.jpg' % i
+            Image.new('RGB', (1000, 600)).save(os.path.join(self.upload_path, filename))
+            self.photos.append(Photo(filename=filename, filename_s=filename, filename_m=filename, processing=True,
+                                     author=author, timestamp=datetime.utcnow() - age))
+        db.session.add_all(self.photos)
+        db.session.commit()
+        self.ids = [photo.id for photo in self.photos]
+
+    def test_requeue_stuck_photos_with_broken_pool(self):
+        with mock.patch.object(self.queue, '_get_executor', return_value=BrokenExecutor()):
+            self.assertEqual(self.queue.requeue_stuck(), 1)
+        db.session.remove()
+        stuck, fresh = [Photo.query.get(photo_id) for photo_id in self.ids]
+        self.assertFalse(stuck.processing)
+        self.assertEqual(stuck.filename_s, '0_s.jpg')
+        self.assertTrue(fresh.processing)
+        self.assertEqual(self.queue._pending, 0)
+
+    def test_failed_job_is_generated_inline(self):
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+        self.queue._pending = 1
+        self.queue._done(self.app, self.ids[1], '1.jpg', future)
+        db.session.remove()
+        photo = Photo.query.get(self.ids[1])
+        self.assertFalse(photo.processing)
+        self.assertEqual(photo.filename_m, '1_m.jpg')
+        self.assertEqual(self.queue._pending, 0)
@@ -0,0 +1,77 @@
+import atexit
+from datetime import datetime, timedelta
+from unittest import mock
+
+from albumy.extensions import db
+from albumy.models import Notification, Tag, User
+from albumy.notifications import NotificationAggregator, push_follow_notification
+from tests.base import BaseTestCase
+
+
+class NotificationAggregatorTestCase(BaseTestCase):
+
+    def test_atexit_registered_once(self):
+        aggregator = NotificationAggregator()
+        with mock.patch.object(atexit, 'register') as register:
+            aggregator.init_app(self.app)
+            aggregator.init_app(self.app)
+        self.assertEqual(register.call_count, 1)
+
+    def test_flush_at_exit(self):
+        self.app.config['ALBUMY_NOTIFICATION_FLUSH_INTERVAL'] = 3600
+        aggregator = NotificationAggregator(self.app)
+        admin = User.query.filter_by(username='admin').first()
+        normal = User.query.filter_by(username='normal').first()
+        normal_id = normal.id
+        with mock.patch('albumy.notifications.notification_aggregator', aggregator):
+            push_follow_notification(follower=admin, receiver=normal)
+        self.assertEqual(Notification.query.count(), 0)
+
+        aggregator._flush_at_exit()
+        db.session.remove()
+        self.assertEqual(Notification.query.count(), 1)
+        self.assertEqual(User.query.get(normal_id).unread_notification_count, 1)
+
+    def test_flush_keeps_caller_session(self):
+        self.app.config['ALBUMY_NOTIFICATION_FLUSH_INTERVAL'] = 3600
+        aggregator = NotificationAggregator(self.app)
+        admin = User.query.filter_by(username='admin').first()
+        normal = User.query.filter_by(username='normal').first()
+        with mock.patch('albumy.notifications.notification_aggregator', aggregator):
+            push_follow_notification(follower=admin, receiver=normal)
+        db.session.add(Tag(name='pending'))
+        self.assertEqual(aggregator.flush(), 1)
+        db.session.rollback()
+        self.assertEqual(Notification.query.count(), 1)
+        self.assertIsNone(Tag.query.filter_by(name='pending').first())
+
+    def test_failed_flush_restores_buffer(self):
+        self.app.config['ALBUMY_NOTIFICATION_FLUSH_INTERVAL'] = 3600
+        aggregator = NotificationAggregator(self.app)
+        admin = User.query.filter_by(username='admin').first()
+        normal = User.query.filter_by(username='normal').first()
+        with mock.patch('albumy.notifications.notification_aggregator', aggregator):
+            push_follow_notification(follower=admin, receiver=normal)
+            with mock.patch.object(type(db), 'engine', mock.PropertyMock(side_effect=RuntimeError)):
+                self.assertRaises(RuntimeError, aggregator.flush)
+            push_follow_notification(follower=normal, receiver=normal)
+        self.assertEqual(aggregator.flush(), 1)
+        self.assertIn('and 1 other users followed you', Notification.query.one().message)
+
+
+class ReadAllNotificationTestCase(BaseTestCase):
+
+    def test_read_all_covers_rows_with_smaller_timestamps(self):
+        normal = User.query.filter_by(username='normal').first()
+        now = datetime.utcnow()
+        # 合并写入时先插入的记录可能带有更晚的时间
+        db.session.add(Notification(message='newer', receiver=normal, timestamp=now))
+        db.session.add(Notification(message='older', receiver=normal, timestamp=now - timedelta(minutes=1)))
+        db.session.commit()
+
+        self.login()
+        response = self.client.get('/notifications')
+        self.assertIn('name="max_id" value="2"', response.get_data(as_text=True))
+        self.client.post('/notifications/read/all', data={'max_id': 2})
+        self.assertEqual(Notification.query.filter_by(is_read=False).count(), 0)
+        self.assertEqual(User.query.filter_by(username='normal').first().unread_notification_count, 0)
@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from albumy.models import Photo
+from albumy.pagination import decode_cursor, encode_cursor
+from tests.base import BaseTestCase
+
+
+class CursorTestCase(BaseTestCase):
+
+    columns = (Photo.timestamp, Photo.id)
+
+    def test_round_trip(self):
+        values = [datetime(2021, 10, 1, 12, 30), 42]
+        self.assertEqual(decode_cursor(encode_cursor(values), self.columns), values)
+
+    def test_invalid_cursor(self):
+        self.assertIsNone(decode_cursor('not a cursor', self.columns))
+        self.assertIsNone(decode_cursor(encode_cursor([1, 2, 3]), self.columns))
+        self.assertIsNone(decode_cursor(encode_cursor({'a': 1, 'b': 2}), self.columns))
+
+    def test_values_of_wrong_type(self):
+        timestamp = '2021-10-01T12:30:00'
+        self.assertIsNone(decode_cursor(encode_cursor([timestamp, '42']), self.columns))
+        self.assertIsNone(decode_cursor(encode_cursor([timestamp, [42]]), self.columns))
+        self.assertIsNone(decode_cursor(encode_cursor([timestamp, True]), self.columns))
+        self.assertIsNone(decode_cursor(encode_cursor([timestamp, None]), self.columns))
+        self.assertIsNone(decode_cursor(encode_cursor([[timestamp], 42]), self.columns))
+
+    def test_tampered_cursor_shows_first_page(self):
+        response = self.client.get('/user/normal?after=%s' % encode_cursor([['x'], {'id': 1}]))
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,25 @@
+import time
+from unittest import mock
+
+from albumy.extensions import db
+from albumy.models import Permission, Role, User
+from tests.base import BaseTestCase
+
+
+class PermissionMapTestCase(BaseTestCase):
+
+    def change_role_in_other_process(self):
+        # 其他进程（例如flask init）修改角色时，版本号只写入它自己的进程内缓存
+        role = Role.query.filter_by(name='User').first()
+        role.permissions.append(Permission.query.filter_by(name='MODERATE').first())
+        db.session.commit()
+
+    def test_map_expires_without_shared_cache(self):
+        user = User.query.filter_by(username='normal').first()
+        self.assertFalse(user.can('MODERATE'))
+        self.change_role_in_other_process()
+        self.assertFalse(user.can('MODERATE'))
+
+        timeout = self.app.config['ALBUMY_PERMISSION_LOCAL_TIMEOUT']
+        with mock.patch('albumy.permissions.time.time', return_value=time.time() + timeout + 1):
+            self.assertTrue(user.can('MODERATE'))
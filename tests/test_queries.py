@@ -0,0 +1,100 @@
+from sqlalchemy import event
+
+from albumy.extensions import db
+from albumy.models import Comment, Photo, Tag, User
+from tests.base import BaseTestCase
+
+
+class QueryCountTestCase(BaseTestCase):
+    '''
+    列表视图的查询次数：数据量大于每页数量，关联对象按loaders中的加载选项批量加载时，查询次数是固定的；
+    如果模板中按行触发了延迟加载，查询次数会随每页的行数增长。
+    '''
+
+    def setUp(self):
+        super().setUp()
+        admin = User.query.filter_by(username='admin').first()
+        normal = User.query.filter_by(username='normal').first()
+        users = [admin, normal]
+        for i in range(14):
+            user = User(email='user%d@helloflask.com' % i, name='User %d' % i, username='user%d' % i, confirmed=True)
+            db.session.add(user)
+            users.append(user)
+        db.session.commit()
+
+        tags = [Tag(name='tag%d' % i) for i in range(3)]
+        photos = []
+        for i in range(14):
+            photo = Photo(filename='%d.jpg' % i, filename_s='%d_s.jpg' % i, filename_m='%d_m.jpg' % i,
+                          author=users[i % 2], tags=tags)
+            db.session.add(photo)
+            photos.append(photo)
+        db.session.commit()
+
+        photo = self.photo = photos[-1]
+        for user in users:
+            user.follow(normal)
+            normal.follow(user)
+            user.collect(photo)
+            normal.collect(photos[users.index(user) % len(photos)])
+            comment = Comment(body='comment', author=user, photo=photo)
+            db.session.add(comment)
+            db.session.add(Comment(body='reply', author=normal, photo=photo, replied=comment))
+        db.session.commit()
+
+    # 请求在自己的应用上下文中执行，会话和g中的数据不会从之前的请求中带过来
+    def count_queries(self, url):
+        engine = db.engine
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        self.context.pop()
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client.get(url)
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+            self.context = self.app.test_request_context()
+            self.context.push()
+        self.assertEqual(response.status_code, 200)
+        return len(statements)
+
+    def assert_queries(self, url, expected):
+        self.assertEqual(self.count_queries(url), expected, url)
+
+    def test_index(self):
+        self.login()
+        self.assert_queries('/', 3)
+
+    def test_show_photo(self):
+        self.assert_queries('/photo/%d' % self.photo.id, 4)
+
+    def test_show_collectors(self):
+        self.assert_queries('/photo/%d/collectors' % self.photo.id, 3)
+
+    def test_show_collections(self):
+        self.assert_queries('/user/normal/collections', 2)
+
+    def test_show_followers(self):
+        self.assert_queries('/user/normal/followers', 3)
+
+    def test_show_following(self):
+        self.assert_queries('/user/normal/following', 3)
+
+    def test_manage_user(self):
+        self.login(email='admin@helloflask.com', password='123')
+        self.assert_queries('/admin/manage/user', 9)
+
+    def test_manage_photo(self):
+        self.login(email='admin@helloflask.com', password='123')
+        self.assert_queries('/admin/manage/photo', 6)
+
+    def test_manage_tag(self):
+        self.login(email='admin@helloflask.com', password='123')
+        self.assert_queries('/admin/manage/tag', 5)
+
+    def test_manage_comment(self):
+        self.login(email='admin@helloflask.com', password='123')
+        self.assert_queries('/admin/manage/comment', 5)
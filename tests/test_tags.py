@@ -0,0 +1,56 @@
+from sqlalchemy import event
+
+from albumy.extensions import db, cache
+from albumy.models import Photo, Tag, User
+from albumy.tags import attach_tags, detach_tag
+from albumy.trending import CHANGES_KEY
+from tests.base import BaseTestCase
+
+
+class TagTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        author = User.query.filter_by(username='normal').first()
+        self.photo = Photo(filename='a.jpg', author=author)
+        self.other = Photo(filename='b.jpg', author=author)
+        db.session.add_all([self.photo, self.other])
+        db.session.commit()
+        attach_tags(self.photo, ['sky', 'sea'])
+        attach_tags(self.other, ['sea'])
+
+    def test_detach_keeps_used_tag(self):
+        sea = Tag.query.filter_by(name='sea').first()
+        self.assertEqual(detach_tag(self.photo, sea), 1)
+        sea = Tag.query.filter_by(name='sea').first()
+        self.assertIsNotNone(sea)
+        self.assertEqual(sea.photo_count, 1)
+
+    def test_detach_deletes_unused_tag_in_one_statement(self):
+        sky = Tag.query.filter_by(name='sky').first()
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            detach_tag(self.photo, sky)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        self.assertIsNone(Tag.query.filter_by(name='sky').first())
+        tag_statements = [statement for statement in statements if statement.startswith('DELETE FROM tag ')]
+        self.assertEqual(len(tag_statements), 1)
+        self.assertIn('NOT (EXISTS', tag_statements[0])
+        self.assertFalse([statement for statement in statements if statement.startswith('SELECT EXISTS')])
+
+    def test_trending_changes_counted_after_commit(self):
+        changes = cache.get(CHANGES_KEY)
+        self.photo.tags.append(Tag(name='rain', photo_count=0))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(cache.get(CHANGES_KEY), changes)
+
+        self.photo.tags.append(Tag(name='rain', photo_count=0))
+        db.session.commit()
+        self.assertEqual(cache.get(CHANGES_KEY), changes + 1)
@@ -0,0 +1,48 @@
+from albumy import usercache
+from albumy.extensions import cache, db
+from albumy.models import User
+from albumy.usercache import load_cached_user
+from tests.base import BaseTestCase
+
+
+class UserCacheTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.query.filter_by(username='normal').first()
+        self.user_id = self.user.id
+        usercache._local.clear()
+
+    def tearDown(self):
+        usercache._local.clear()
+        cache.init_app(self.app)
+        super().tearDown()
+
+    def use_shared_cache(self):
+        cache.init_app(self.app, config={'CACHE_TYPE': 'FileSystemCache', 'CACHE_DIR': self.upload_path})
+
+    def test_process_local_cache_is_not_used(self):
+        load_cached_user(self.user_id)
+        self.assertIsNone(cache.get(usercache.USER_KEY % self.user_id))
+        self.assertEqual(len(usercache._local), 0)
+
+    def test_snapshot_is_invalidated_after_commit(self):
+        self.use_shared_cache()
+        db.session.remove()
+        self.assertFalse(load_cached_user(self.user_id).locked)
+        self.assertIsNotNone(cache.get(usercache.USER_KEY % self.user_id))
+
+        user = User.query.get(self.user_id)
+        user.lock()
+        self.assertIsNone(cache.get(usercache.USER_KEY % self.user_id))
+        db.session.remove()
+        self.assertTrue(load_cached_user(self.user_id).locked)
+
+    def test_local_snapshots_are_bounded(self):
+        self.use_shared_cache()
+        self.app.config['ALBUMY_USER_CACHE_LOCAL_SIZE'] = 1
+        admin = User.query.filter_by(username='admin').first()
+        db.session.remove()
+        load_cached_user(self.user_id)
+        load_cached_user(admin.id)
+        self.assertEqual(list(usercache._local), [admin.id])